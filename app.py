@@ -1,8 +1,8 @@
 # app.py
 import sys
 import os
+import threading
 from flask import Flask, render_template, request, Response, stream_with_context
-import json # To potentially send structured error messages
 import uuid  # For generating conversation IDs
 
 # Add the src directory to the Python path to find ChatClient
@@ -12,23 +12,57 @@ if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
 try:
-    # Import app-specific classes/exceptions from ChatClient.
-    # Note: `RuntimeError` is a built-in exception; no import needed.
-    from ChatClient import ChatClient, AuthenticationError, BadRequestError
+    # Error events are built by streaming.SSE.error_payload
+    from ChatClient import ChatClient
+    from streaming.SSE import format_event, error_payload
+    from streaming.ChatStream import admission, replays, new_frame_writer, EXPIRED_STREAM
+    from metrics import Metrics as metrics
+    from admission.AdmissionControl import AdmissionRejected
+    from config.config import TRUSTED_PROXY_HOPS
 except ImportError as e:
     print(f"Error importing ChatClient: {e}")
     print("Ensure ChatClient.py is in the 'src' directory and src is in PYTHONPATH.")
     sys.exit(1)
 
 app = Flask(__name__)
-
-# Instantiate your ChatClient once
-try:
-    chat_client = ChatClient()
-except Exception as e:
-    print(f"Error initializing ChatClient: {e}")
-    # Handle initialization error appropriately, maybe exit or provide a dummy client
-    chat_client = None # Or raise an error
+if TRUSTED_PROXY_HOPS:
+    # Take the client IP (used for rate limiting) from X-Forwarded-For
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
+# The ChatClient is built once, on the first request rather than at import:
+# asgi.py serves /chat_stream with its own AsyncChatClient and only borrows
+# this Flask app for pages and /metrics, so it turns CHAT_CLIENT_ENABLED off
+# and no sync client (or warm-up thread) is ever built there.
+app.config['CHAT_CLIENT_ENABLED'] = True
+chat_client = None
+_chat_client_lock = threading.Lock()
+_chat_client_failed = False
+
+def get_chat_client():
+    """The shared ChatClient, built on first use; None if it failed to initialize."""
+    global chat_client, _chat_client_failed
+    if chat_client is None and not _chat_client_failed:
+        with _chat_client_lock:
+            if chat_client is None and not _chat_client_failed:
+                try:
+                    client = ChatClient()
+                except Exception as e:
+                    print(f"Error initializing ChatClient: {e}")
+                    _chat_client_failed = True
+                    return None
+                # Scrape-time gauges (stored conversations, cache, circuits) read this client
+                metrics.bind_client(client)
+                # Open upstream connections (DNS, TCP, TLS) before the first question arrives
+                threading.Thread(target=client.warm_up, name="upstream-warmup", daemon=True).start()
+                chat_client = client
+    return chat_client
+
+@app.before_request
+def start_chat_client():
+    # Usually the page load, so the client is warm by the time a question is asked
+    if app.config['CHAT_CLIENT_ENABLED']:
+        get_chat_client()
 
 @app.route('/')
 def index():
@@ -44,24 +78,31 @@ def author():
     return render_template('author.html')
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics for this process."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/chat_stream')
 def chat_stream():
     """
     Handles the streaming chat request using Server-Sent Events (SSE).
     Takes the question as a query parameter.
     """
+    chat_client = get_chat_client()
     if not chat_client:
          # Function to send an SSE error message
         def error_stream():
             error_message = "Chat client failed to initialize on the server."
-            yield f"event: error\ndata: {json.dumps({'error': error_message})}\n\n"
+            yield format_event({'error': error_message}, 'error')
         return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
 
     question = request.args.get('question', '') # Get question from query param
     if not question:
         def error_stream():
             error_message = "No question provided."
-            yield f"event: error\ndata: {json.dumps({'error': error_message})}\n\n"
+            yield format_event({'error': error_message}, 'error')
         return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
 
     # Determine per-visitor conversation_id via cookie (one ID per visitor)
@@ -70,47 +111,72 @@ def chat_stream():
         conversation_id = cid_cookie
     else:
         conversation_id = str(uuid.uuid4())
-    # Ensure a history bucket exists (idempotent)
-    chat_client.start_conversation(conversation_id)
+    client_ip = request.remote_addr or "unknown"
+    # Sent by EventSource when it reconnects after a dropped connection
+    last_event_id = request.headers.get('Last-Event-ID')
 
     def generate_sse():
         """Generates SSE formatted stream data."""
+        writer = new_frame_writer()
+        # Over the rate limits or capacity: a single 'error' event, before
+        # any history or upstream work
+        try:
+            ticket = admission.admit(conversation_id, client_ip) if admission else None
+        except AdmissionRejected as e:
+            metrics.SSE_STREAMS.inc("rejected")
+            yield writer.event(error_payload(e), 'error')
+            return
+        # Ensure a history bucket exists (idempotent)
+        chat_client.start_conversation(conversation_id)
+        metrics.SSE_ACTIVE_STREAMS.inc()
+        result = "disconnect" # Unless we reach 'end' or 'error' below
         try:
             # Optionally announce the conversation ID
-            yield f"event: cid\ndata: {json.dumps({'cid': conversation_id})}\n\n"
+            yield writer.event({'cid': conversation_id}, 'cid')
 
             # Use the generator from ChatClient with conversation context
             stream_generator = chat_client.chat_with_model_stream(
                 question,
                 conversation_id=conversation_id,
             )
-            for chunk in stream_generator:
-                # Format as SSE: data: <chunk>\n\n
-                yield f"data: {json.dumps(chunk)}\n\n" # Send data as JSON string
+            # Coalesced data frames (JSON string chunks) plus idle heartbeats
+            yield from writer.stream(stream_generator)
             # Signal the end of the stream (optional, but good practice)
-            yield "event: end\ndata: {}\n\n"
-
-        # --- Handle specific errors from ChatClient that stop the process ---
-        except (AuthenticationError, BadRequestError) as e:
-            print(f"SSE Stream Error (Critical): {e}") # Log server-side
-            # Send a specific error event to the client
-            error_data = {'error': f"API Error: {type(e).__name__}", 'message': str(e)}
-            yield f"event: error\ndata: {json.dumps(error_data)}\n\n"
-        except RuntimeError as e: # Catch the "all models failed" error
-            print(f"SSE Stream Error (Runtime): {e}") # Log server-side
-            error_data = {'error': "Runtime Error", 'message': str(e)}
-            yield f"event: error\ndata: {json.dumps(error_data)}\n\n"
+            result = "end"
+            yield writer.event({}, 'end')
+
+        # Errors from ChatClient that stop the process (critical API errors,
+        # the "all models failed" RuntimeError, anything unexpected) are
+        # logged server-side and sent to the client as an 'error' event.
         except Exception as e:
-            # Catch any other unexpected errors during generation
-            print(f"SSE Stream Error (Unexpected): {e}") # Log server-side
-            import traceback
-            traceback.print_exc() # Log full traceback
-            error_data = {'error': "Unexpected Server Error", 'message': "An error occurred while generating the response."}
-            yield f"event: error\ndata: {json.dumps(error_data)}\n\n"
+            result = "error"
+            yield writer.event(error_payload(e), 'error')
+        finally:
+            metrics.SSE_ACTIVE_STREAMS.dec()
+            metrics.SSE_STREAMS.inc(result)
+            if ticket:
+                ticket.release()
+
+    if not replays:
+        frames = generate_sse()
+    elif last_event_id:
+        # Pick the stream up where the browser lost it rather than asking again
+        frames = replays.resume(last_event_id, conversation_id)
+        if frames is None:
+            metrics.SSE_RESUMES.inc("expired")
+            frames = iter([new_frame_writer().event(EXPIRED_STREAM, 'error')])
+        else:
+            metrics.SSE_RESUMES.inc("resumed")
+            print(f"🔌 Resuming stream after event {last_event_id}", flush=True)
+    else:
+        # Generate on a background thread so a reconnect can rejoin it
+        frames = replays.start(conversation_id, generate_sse())
 
     # Return a streaming response with the correct mimetype for SSE
     # and set/update the visitor cookie with the conversation_id.
-    resp = Response(stream_with_context(generate_sse()), mimetype='text/event-stream')
+    resp = Response(stream_with_context(frames), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no' # Don't let nginx-style proxies buffer frames
     resp.set_cookie('cid', conversation_id, max_age=60*60*24*30, samesite='Lax')
     return resp
 
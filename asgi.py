@@ -0,0 +1,231 @@
+# asgi.py
+"""
+ASGI entry point serving the same SSE protocol as app.py from an event loop.
+
+/chat_stream is handled natively with AsyncChatClient, so an open stream costs
+a coroutine instead of a worker thread. Every other route (pages, static
+files) is delegated to the Flask app from app.py.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+or under gunicorn:
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+Reconnects are resumed from an in-process replay buffer (SSE_REPLAY_ENABLED),
+so with more than one worker route each visitor to the same worker (sticky
+sessions) or run a single worker; otherwise a dropped stream is lost.
+"""
+import asyncio
+import io
+import sys
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from app import app as flask_app  # Also puts src/ on sys.path
+
+# /chat_stream is served below with AsyncChatClient: the Flask app must not build its own ChatClient
+flask_app.config['CHAT_CLIENT_ENABLED'] = False
+
+try:
+    from AsyncChatClient import AsyncChatClient
+    from streaming.SSE import format_event, error_payload
+    from streaming.ChatStream import admission, replays, new_frame_writer, EXPIRED_STREAM
+    from metrics import Metrics as metrics
+    from admission.AdmissionControl import AdmissionRejected
+except ImportError as e:
+    print(f"Error importing AsyncChatClient: {e}")
+    sys.exit(1)
+
+try:
+    async_chat_client = AsyncChatClient()
+except Exception as e:
+    print(f"Error initializing AsyncChatClient: {e}")
+    async_chat_client = None
+
+if async_chat_client:
+    # /metrics (served by the Flask app) should describe this client's stores
+    metrics.bind_client(async_chat_client)
+
+COOKIE_MAX_AGE = 60*60*24*30
+
+
+async def chat_stream(scope, receive, send):
+    """Async twin of app.chat_stream: SSE frames for one question."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    question = query.get("question", [""])[0]
+
+    cookies = SimpleCookie()
+    last_event_id = None
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookies.load(value.decode("latin-1"))
+        elif name == b"last-event-id":
+            last_event_id = value.decode("latin-1")
+    conversation_id = cookies["cid"].value if "cid" in cookies else str(uuid.uuid4())
+
+    headers = [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]
+    if async_chat_client and question:
+        cookie = f"cid={conversation_id}; Max-Age={COOKIE_MAX_AGE}; Path=/; SameSite=Lax"
+        headers.append((b"set-cookie", cookie.encode("latin-1")))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+    async def emit(frame: str):
+        await send({"type": "http.response.body", "body": frame.encode("utf-8"), "more_body": True})
+
+    async def generate_frames():
+        if not async_chat_client:
+            yield format_event({'error': "Chat client failed to initialize on the server."}, 'error')
+            return
+        if not question:
+            yield format_event({'error': "No question provided."}, 'error')
+            return
+        writer = new_frame_writer()
+        # Waits on the event loop while queued; rejected requests get one 'error' event
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        try:
+            ticket = await admission.admit_async(conversation_id, client_ip) if admission else None
+        except AdmissionRejected as e:
+            metrics.SSE_STREAMS.inc("rejected")
+            yield writer.event(error_payload(e), 'error')
+            return
+        await asyncio.to_thread(async_chat_client.start_conversation, conversation_id)
+        metrics.SSE_ACTIVE_STREAMS.inc()
+        result = "disconnect" # Unless we reach 'end' or 'error' below
+        try:
+            yield writer.event({'cid': conversation_id}, 'cid')
+            chunks = async_chat_client.chat_with_model_stream(question, conversation_id=conversation_id)
+            async for frame in writer.astream(chunks):
+                yield frame
+            result = "end"
+            yield writer.event({}, 'end')
+        except Exception as e:
+            result = "error"
+            yield writer.event(error_payload(e), 'error')
+        finally:
+            metrics.SSE_ACTIVE_STREAMS.dec()
+            metrics.SSE_STREAMS.inc(result)
+            if ticket:
+                ticket.release()
+
+    async def generate_sse():
+        if not (replays and async_chat_client and question):
+            frames = generate_frames()
+        elif last_event_id:
+            # Pick the stream up where the browser lost it rather than asking again
+            frames = replays.aresume(last_event_id, conversation_id)
+            if frames is None:
+                metrics.SSE_RESUMES.inc("expired")
+                await emit(new_frame_writer().event(EXPIRED_STREAM, 'error'))
+                return
+            metrics.SSE_RESUMES.inc("resumed")
+            print(f"🔌 Resuming stream after event {last_event_id}", flush=True)
+        else:
+            # The generation runs as its own task so a reconnect can rejoin it
+            frames = replays.astart(conversation_id, generate_frames())
+        try:
+            async for frame in frames:
+                await emit(frame)
+        finally:
+            await frames.aclose()
+
+    async def wait_for_disconnect():
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    # Stop streaming as soon as the browser goes away (with the replay buffer
+    # the generation itself lingers for SSE_REPLAY_GRACE_SECONDS).
+    stream_task = asyncio.ensure_future(generate_sse())
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect())
+    done, pending = await asyncio.wait({stream_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    if stream_task in done:
+        stream_task.result()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def wsgi_fallback(scope, receive, send):
+    """Serve a (non-streaming) request through the Flask WSGI app in a thread."""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+
+    def run():
+        result = flask_app(environ, start_response)
+        try:
+            return b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    payload = await asyncio.to_thread(run)
+    await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+    await send({"type": "http.response.body", "body": payload, "more_body": False})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if async_chat_client:
+                    # Pooled connections belong to this event loop, so warm them here
+                    await async_chat_client.warm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if async_chat_client:
+                    await async_chat_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/chat_stream":
+        await chat_stream(scope, receive, send)
+    else:
+        await wsgi_fallback(scope, receive, send)
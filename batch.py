@@ -0,0 +1,311 @@
+# batch.py
+"""Answer a JSONL file of questions through ChatClient, concurrently.
+
+Each input line is a JSON object::
+
+    {"id": "q1", "question": "What is a neutron star?", "conversation_id": "tour-1"}
+
+``id`` defaults to the line number. Lines sharing a ``conversation_id`` form a
+multi-turn script: they run one after the other, in file order, with the
+earlier turns as context. If a turn fails, the later turns of its
+conversation are not asked (they would lack that context) and are recorded
+as blocked. Lines without a ``conversation_id`` are independent questions.
+
+Results are appended to the output JSONL as soon as each item finishes
+(answer, model used, source, latency, TTFT, error). Rerunning with the same
+output file skips the items that already have an answer, so an interrupted
+or crashed run picks up where it stopped; items that failed are retried.
+
+When upstream pacing has every model at its request rate, an item waits for
+the earliest model's budget and tries again (up to ``--max-pacing-wait``
+seconds in total) instead of failing.
+
+Usage:
+    python batch.py questions.jsonl --output answers.jsonl --concurrency 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterator, List, Optional
+
+src_path = os.path.join(os.path.dirname(__file__), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from ChatClient import ChatClient
+from admission.AdmissionControl import AdmissionRejected
+from streaming.SSE import STREAM_RESET
+
+
+def read_items(path: str) -> Iterator[dict]:
+    """Yield the questions of an input JSONL file, one dict per line."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Skipping line {line_no}: invalid JSON ({e})", flush=True)
+                continue
+            question = item.get("question") if isinstance(item, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                print(f"⚠️ Skipping line {line_no}: no question", flush=True)
+                continue
+            conversation_id = item.get("conversation_id")
+            yield {
+                "id": str(item.get("id", line_no)),
+                "line": line_no,
+                "question": question,
+                "conversation_id": None if conversation_id is None else str(conversation_id),
+            }
+
+
+def read_results(path: str) -> Dict[str, dict]:
+    """Finished items of a previous run of ``path``, keyed by id. A line cut
+    short by a crash is ignored (its item simply runs again)."""
+    done: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("error") is None and "id" in record:
+                done[str(record["id"])] = record
+    return done
+
+
+class ResultWriter:
+    """Append one JSON line per finished item, flushed right away."""
+
+    def __init__(self, path: str):
+        # Terminate a line left half-written by a crash before appending
+        needs_newline = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class BatchRunner:
+    """Run the items of a JSONL file through one ChatClient with at most
+    ``concurrency`` questions in flight. Turns of one conversation are
+    chained on the same worker so they keep their order and context."""
+
+    def __init__(self, client: ChatClient, writer: ResultWriter, done: Dict[str, dict], concurrency: int,
+                 max_pacing_wait: float = 600.0):
+        self.client = client
+        self.writer = writer
+        self.done = done
+        self.concurrency = max(1, concurrency)
+        self.max_pacing_wait = max_pacing_wait  # Per item, while every model is paced out
+        self._slots = threading.Semaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._chains: Dict[str, Deque[dict]] = {}  # Running conversation -> turns still to ask
+        self.counts = {"ok": 0, "failed": 0, "blocked": 0, "skipped": 0}
+
+    def run(self, items: Iterator[dict]) -> None:
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as pool:
+            for item in items:
+                if item["id"] in self.done:
+                    self.counts["skipped"] += 1
+                    continue
+                conversation_id = item["conversation_id"]
+                if conversation_id is not None:
+                    with self._lock:
+                        chain = self._chains.get(conversation_id)
+                        if chain is not None:
+                            # A worker is already on this conversation; it will take this turn next
+                            chain.append(item)
+                            continue
+                        self._chains[conversation_id] = deque([item])
+                # Bound the number of queued tasks too, so huge files stream through
+                self._slots.acquire()
+                pool.submit(self._run_chain if conversation_id is not None else self._run_single, item)
+
+    def _run_single(self, item: dict) -> None:
+        try:
+            self._ask(item, f"batch-{uuid.uuid4()}")
+        finally:
+            self._slots.release()
+
+    def _run_chain(self, item: dict) -> None:
+        conversation_id = item["conversation_id"]
+        try:
+            self._seed_history(conversation_id, item["line"])
+            failed: Optional[str] = None  # id of the turn that broke the chain
+            while True:
+                with self._lock:
+                    chain = self._chains[conversation_id]
+                    if not chain:
+                        del self._chains[conversation_id]
+                        return
+                    item = chain.popleft()
+                if failed is not None:
+                    self._block(item, failed)
+                elif not self._ask(item, conversation_id):
+                    failed = item["id"]
+        except BaseException:
+            with self._lock:
+                self._chains.pop(conversation_id, None)
+            raise
+        finally:
+            self._slots.release()
+
+    def _seed_history(self, conversation_id: str, line: int) -> None:
+        """On resume, give a conversation the turns a previous run already
+        answered if the history store no longer has them (memory backend)."""
+        if self.client.get_history(conversation_id):
+            return
+        earlier: List[dict] = sorted(
+            (r for r in self.done.values() if r.get("conversation_id") == conversation_id and r["line"] < line),
+            key=lambda r: r["line"],
+        )
+        if not earlier:
+            return
+        with self.client.histories.lock(conversation_id):
+            for record in earlier:
+                self.client.histories.append(
+                    conversation_id,
+                    {"role": "user", "content": record["question"]},
+                    {"role": "assistant", "content": record["answer"]},
+                )
+        print(f"🧵 Restored {len(earlier)} earlier turn(s) of conversation {conversation_id}", flush=True)
+
+    def _record(self, item: dict, **fields) -> None:
+        self.writer.write({
+            "id": item["id"],
+            "line": item["line"],
+            "conversation_id": item["conversation_id"],
+            "question": item["question"],
+            **fields,
+            "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+
+    def _block(self, item: dict, failed_id: str) -> None:
+        """Record a turn skipped because an earlier turn of its conversation
+        failed. It has an error, so a rerun asks it again, after that turn."""
+        error = f"Blocked: earlier turn {failed_id} of this conversation failed"
+        self._record(item, answer=None, model=None, source=None, latency_seconds=0.0, ttft_seconds=None,
+                     error=error)
+        with self._lock:
+            self.counts["blocked"] += 1
+        print(f"⛔ [{item['id']}] {error}", flush=True)
+
+    def _ask(self, item: dict, conversation_id: str) -> bool:
+        """Ask one item and record the result; True if it was answered."""
+        outcome: dict = {}
+        parts: List[str] = []
+        error: Optional[str] = None
+        ttft: Optional[float] = None
+        started = time.monotonic()
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                for chunk in self.client.chat_with_model_stream(item["question"], conversation_id, outcome):
+                    if chunk is STREAM_RESET:
+                        parts.clear()
+                        continue
+                    if ttft is None:
+                        ttft = time.monotonic() - attempt_started
+                    parts.append(chunk)
+            except AdmissionRejected as e:
+                # Every model is at its request rate: nothing was sent upstream
+                # and the user turn was rolled back, so wait for budget and retry.
+                # Jitter keeps paced-out workers from all waking at once.
+                delay = e.retry_after + random.uniform(0.0, 1.0 + e.retry_after * 0.1)
+                if e.reason == "model_pacing" and time.monotonic() + delay - started <= self.max_pacing_wait:
+                    print(f"🚦 [{item['id']}] all models paced out; retrying in {delay:.1f}s", flush=True)
+                    time.sleep(delay)
+                    continue
+                error = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            break
+        latency = time.monotonic() - started
+
+        self._record(
+            item,
+            answer="".join(parts) if error is None else None,
+            model=outcome.get("model"),
+            source=outcome.get("source"),
+            latency_seconds=round(latency, 3),
+            ttft_seconds=None if ttft is None else round(ttft, 3),
+            error=error,
+        )
+        with self._lock:
+            self.counts["failed" if error else "ok"] += 1
+        if error:
+            print(f"❌ [{item['id']}] failed after {latency:.1f}s: {error}", flush=True)
+        else:
+            print(f"✅ [{item['id']}] {outcome.get('model') or 'no model'} ({outcome.get('source')}) in {latency:.1f}s",
+                  flush=True)
+        return error is None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions through ChatClient.")
+    parser.add_argument("input", help="JSONL file with one {\"question\", \"id\"?, \"conversation_id\"?} per line")
+    parser.add_argument("--output", help="Results JSONL (default: <input>.results.jsonl); reused to resume")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight at once")
+    parser.add_argument("--max-pacing-wait", type=float, default=600.0,
+                        help="Seconds an item may wait for model budget while every model is paced out")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    done = read_results(output)
+    if done:
+        print(f"♻️ Resuming: {len(done)} item(s) already answered in {output}", flush=True)
+
+    client = ChatClient()
+    client.warm_up()
+    writer = ResultWriter(output)
+    runner = BatchRunner(client, writer, done, args.concurrency, args.max_pacing_wait)
+    started = time.monotonic()
+    try:
+        runner.run(read_items(args.input))
+    except KeyboardInterrupt:
+        print(f"\n⏹️ Interrupted; finished items are saved in {output}. Rerun the same command to resume.",
+              flush=True)
+        return 130
+    finally:
+        writer.close()
+        flush = getattr(client.histories, "flush", None)
+        if flush is not None:
+            flush()
+
+    counts = runner.counts
+    print(f"🏁 {counts['ok']} answered, {counts['failed']} failed, {counts['blocked']} blocked, "
+          f"{counts['skipped']} already done in {time.monotonic() - started:.1f}s -> {output}", flush=True)
+    return 1 if counts["failed"] or counts["blocked"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# bench/fake_openai_server.py
+"""
+Local stand-in for an OpenAI-compatible chat-completions endpoint.
+
+Speaks the streaming protocol ChatClient uses (POST /v1/chat/completions with
+stream=true, answered with `data: {chunk}` frames and `data: [DONE]`), so the
+app can be exercised without spending OpenRouter quota. Point the app at it
+with OPENROUTER_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Behaviour is configurable per run and seeded, so results are comparable:
+    python bench/fake_openai_server.py --port 9100 --token-rate 40 \\
+        --first-token-delay 0.8 --stall-prob 0.05 --stall-seconds 3 \\
+        --fail "v3.1:429:0.3" --fail "nemotron:empty:1"
+
+--fail MODEL_SUBSTRING:KIND:PROBABILITY injects failures for matching
+models, KIND being an HTTP status (429, 404, 401, 403, 500...), "empty"
+(a 200 stream that carries no content), "stall" (goes silent for
+--stall-seconds a third of the way into the answer) or "drop" (closes the
+connection a third of the way into the answer).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+WORDS = (
+    "the moon orbits earth at an average distance of about three hundred eighty four thousand "
+    "kilometres while light from the sun takes roughly eight minutes to reach us and black holes "
+    "form when massive stars collapse under their own gravity"
+).split()
+
+
+class FakeConfig:
+    def __init__(self, token_rate: float = 50.0, first_token_delay: float = 0.3, tokens: int = 120,
+                 stall_prob: float = 0.0, stall_seconds: float = 2.0,
+                 failures: Optional[List[Tuple[str, str, float]]] = None, seed: int = 1):
+        self.token_rate = token_rate
+        self.first_token_delay = first_token_delay
+        self.tokens = tokens
+        self.stall_prob = stall_prob
+        self.stall_seconds = stall_seconds
+        self.failures = failures or []
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        # Upstream call counts per (model, outcome), read back by the load test
+        self.calls: Dict[Tuple[str, str], int] = {}
+        self.calls_lock = threading.Lock()
+
+    def random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def count(self, model: str, outcome: str) -> None:
+        with self.calls_lock:
+            self.calls[(model, outcome)] = self.calls.get((model, outcome), 0) + 1
+
+    def failure_for(self, model: str) -> Optional[str]:
+        for substring, kind, probability in self.failures:
+            if substring in model and self.random() < probability:
+                return kind
+        return None
+
+
+def parse_failure(spec: str) -> Tuple[str, str, float]:
+    substring, kind, probability = spec.rsplit(":", 2)
+    return substring, kind, float(probability)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeConfig = None  # Set by make_server()
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _frame(self, model: str, content: Optional[str]) -> str:
+        delta = {"content": content} if content is not None else {}
+        chunk = {
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None if content is not None else "stop"}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "unknown")
+        config = self.config
+        # Honour an assistant prefill (partial answer to continue) like real providers
+        messages = body.get("messages") or [{}]
+        prefill = messages[-1].get("content", "") if messages[-1].get("role") == "assistant" else ""
+        start = len(prefill.split())
+
+        failure = config.failure_for(model)
+        if failure and failure.isdigit():
+            config.count(model, failure)
+            headers = {"Retry-After": "5"} if failure == "429" else None
+            self._json(int(failure), {"error": {"message": f"Injected {failure} for {model}", "code": int(failure)}},
+                       headers)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            time.sleep(config.first_token_delay)
+            if failure == "empty":
+                config.count(model, "empty")
+            else:
+                interval = 1.0 / config.token_rate if config.token_rate > 0 else 0.0
+                for i in range(start, config.tokens):
+                    if failure and i == config.tokens // 3:
+                        config.count(model, failure)
+                        if failure == "drop":
+                            self.close_connection = True
+                            return
+                        time.sleep(config.stall_seconds)  # "stall"
+                    if config.stall_prob and config.random() < config.stall_prob:
+                        time.sleep(config.stall_seconds)
+                    word = WORDS[i % len(WORDS)]
+                    self._write_chunk(self._frame(model, word if i == 0 or prefill.endswith(" ") and i == start
+                                                  else " " + word))
+                    if interval:
+                        time.sleep(interval)
+                if not failure:
+                    config.count(model, "ok")
+            self._write_chunk(self._frame(model, None))
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            config.count(model, "client_closed")
+
+
+def make_server(config: FakeConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Build (not start) a fake server; port 0 picks a free port."""
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens per second (0 = as fast as possible)")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens per answer")
+    parser.add_argument("--stall-prob", type=float, default=0.0, help="Per-token probability of a stall")
+    parser.add_argument("--stall-seconds", type=float, default=2.0, help="Length of a stall")
+    parser.add_argument("--fail", action="append", default=[], metavar="MODEL:KIND:PROB",
+                        help="Inject failures, e.g. v3.1:429:0.5 or nemotron:empty:1")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = FakeConfig(args.token_rate, args.first_token_delay, args.tokens, args.stall_prob,
+                        args.stall_seconds, [parse_failure(f) for f in args.fail], args.seed)
+    server = make_server(config, args.host, args.port)
+    print(f"Fake OpenAI server on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+# bench/load_test.py
+"""
+Load test for /chat_stream against the fake upstream in bench/fake_openai_server.py.
+
+Starts the fake OpenAI-compatible server and the app (Flask or the ASGI entry
+point) in this process, points the app at the fake with OPENROUTER_BASE_URL,
+then drives N concurrent SSE clients, each holding its own conversation (cid
+cookie) for a number of turns. Reports client-side TTFT and total latency
+percentiles, throughput, history store growth, and the model fallback
+counters scraped from /metrics.
+
+Everything random is seeded and the full run configuration is written next
+to the results, so two JSON files from different commits can be compared:
+    python bench/load_test.py --clients 50 --turns 4 --output before.json
+    python bench/load_test.py --clients 50 --turns 4 --fail "v3.1:429:0.3" --output after.json
+
+--app-url runs the clients against an already running app instead (history
+store growth is then only available as the conversation gauge).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_openai_server import FakeConfig, make_server, parse_failure  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "How far away is the Moon?",
+    "What is a black hole?",
+    "Why is Mars red?",
+    "How long does sunlight take to reach Earth?",
+    "What is a light year?",
+    "How many moons does Jupiter have?",
+    "What is the Kuiper belt?",
+    "How hot is the surface of Venus?",
+    "What causes a solar eclipse?",
+    "How old is the universe?",
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for an empty sample)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# --- /metrics scraping ---
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def scrape_metrics(host: str, port: int) -> Dict[Tuple[str, str], float]:
+    """``{(metric_name, label_string): value}`` from the app's /metrics."""
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("GET", "/metrics")
+        text = conn.getresponse().read().decode("utf-8")
+    finally:
+        conn.close()
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and not line.startswith("#"):
+            samples[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def counter_delta(before: dict, after: dict, name: str) -> Dict[str, float]:
+    return {
+        labels or "total": value - before.get((metric, labels), 0.0)
+        for (metric, labels), value in after.items()
+        if metric == name and value - before.get((metric, labels), 0.0)
+    }
+
+
+# --- SSE client ---
+
+class StreamResult:
+    __slots__ = ("ok", "ttft", "total", "chars", "frames", "heartbeats", "resets", "error")
+
+    def __init__(self):
+        self.ok = False
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.chars = 0
+        self.frames = 0
+        self.heartbeats = 0
+        self.resets = 0
+        self.error: Optional[str] = None
+
+
+def run_stream(host: str, port: int, question: str, cid: Optional[str], timeout: float) -> Tuple[StreamResult, Optional[str]]:
+    """Issue one /chat_stream request and parse its SSE frames."""
+    result = StreamResult()
+    headers = {"Accept": "text/event-stream"}
+    if cid:
+        headers["Cookie"] = f"cid={cid}"
+    started = time.monotonic()
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", f"/chat_stream?question={quote(question)}", headers=headers)
+        response = conn.getresponse()
+        event, data = None, []
+        for raw in response:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith(":"):
+                result.heartbeats += 1
+                continue
+            if line.startswith("event:"):
+                event = line[6:].strip()
+                continue
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip(" ") if line.startswith("data: ") else line[5:])
+                continue
+            if line or not data:
+                continue
+            # Blank line: dispatch the frame
+            payload = json.loads("\n".join(data))
+            if event is None:
+                if result.ttft is None:
+                    result.ttft = time.monotonic() - started
+                result.chars += len(payload)
+                result.frames += 1
+            elif event == "cid":
+                cid = payload.get("cid", cid)
+            elif event == "reset":
+                result.resets += 1
+                result.chars = 0
+            elif event == "error":
+                result.error = payload.get("error", "error")
+                break
+            elif event == "end":
+                result.ok = True
+                break
+            event, data = None, []
+        if not result.ok and result.error is None:
+            result.error = "stream closed without end"
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        result.error = type(e).__name__
+    finally:
+        conn.close()
+    result.total = time.monotonic() - started
+    return result, cid
+
+
+# --- App under test ---
+
+def start_app(kind: str, fake_url: str):
+    """Import and serve the app in-process; returns (host, port, chat_client, stop)."""
+    # config.config only fills unset variables from .env, so these win
+    os.environ["OPENROUTER_BASE_URL"] = fake_url
+    os.environ["OPENROUTER_API_KEY"] = "sk-bench"
+    # All clients share one IP and the fake has no quota: measure the app
+    # itself unless these are exported to benchmark them
+    os.environ.setdefault("ADMISSION_ENABLED", "0")
+    os.environ.setdefault("MODEL_PACING_ENABLED", "0")
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(REPO_ROOT)
+    port = free_port()
+
+    if kind == "flask":
+        import logging
+        from werkzeug.serving import make_server as make_wsgi_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # No per-request access log
+        import app as app_module
+        server = make_wsgi_server("127.0.0.1", port, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+        return "127.0.0.1", port, app_module.get_chat_client(), server.shutdown
+
+    import uvicorn
+    import asgi as asgi_module
+    server = uvicorn.Server(uvicorn.Config(asgi_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-app", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+
+    return "127.0.0.1", port, asgi_module.async_chat_client, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    run = parser.add_argument_group("load")
+    run.add_argument("--clients", type=int, default=20, help="Concurrent SSE clients")
+    run.add_argument("--turns", type=int, default=3, help="Questions per client conversation")
+    run.add_argument("--distinct-questions", type=int, default=len(QUESTIONS),
+                     help="Size of the question pool (smaller = more cache / single-flight hits)")
+    run.add_argument("--ramp", type=float, default=0.0, help="Seconds over which client start times are spread")
+    run.add_argument("--timeout", type=float, default=120.0, help="Per-request socket timeout")
+    run.add_argument("--server", choices=("flask", "asgi"), default="flask", help="In-process app to test")
+    run.add_argument("--app-url", help="Test an already running app instead (e.g. http://127.0.0.1:8080)")
+    run.add_argument("--label", default="", help="Free-form tag stored with the results")
+    run.add_argument("--output", help="Write results JSON here")
+    fake = parser.add_argument_group("fake upstream")
+    fake.add_argument("--token-rate", type=float, default=50.0)
+    fake.add_argument("--first-token-delay", type=float, default=0.3)
+    fake.add_argument("--tokens", type=int, default=120)
+    fake.add_argument("--stall-prob", type=float, default=0.0)
+    fake.add_argument("--stall-seconds", type=float, default=2.0)
+    fake.add_argument("--fail", action="append", default=[], metavar="MODEL:KIND:PROB")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fake_config = FakeConfig(args.token_rate, args.first_token_delay, args.tokens, args.stall_prob,
+                             args.stall_seconds, [parse_failure(f) for f in args.fail], args.seed)
+    fake_server = make_server(fake_config)
+    threading.Thread(target=fake_server.serve_forever, name="bench-fake", daemon=True).start()
+    fake_url = f"http://127.0.0.1:{fake_server.server_address[1]}/v1"
+    print(f"🛰️ Fake upstream on {fake_url}", flush=True)
+
+    chat_client, stop_app = None, None
+    if args.app_url:
+        parts = urlsplit(args.app_url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port, chat_client, stop_app = start_app(args.server, fake_url)
+        print(f"🚀 {args.server} app on http://{host}:{port}", flush=True)
+
+    rng = random.Random(args.seed)
+    pool = QUESTIONS[:max(1, min(args.distinct_questions, len(QUESTIONS)))]
+    plans = [[rng.choice(pool) for _ in range(args.turns)] for _ in range(args.clients)]
+    results: List[StreamResult] = []
+    results_lock = threading.Lock()
+
+    def client(index: int):
+        if args.ramp and args.clients > 1:
+            time.sleep(args.ramp * index / (args.clients - 1))
+        cid = None
+        for question in plans[index]:
+            result, cid = run_stream(host, port, question, cid, args.timeout)
+            with results_lock:
+                results.append(result)
+
+    metrics_before = scrape_metrics(host, port)
+    histories_before = chat_client.histories.stats() if chat_client else None
+    rss_before = rss_bytes()
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+    rss_after = rss_bytes()
+    histories_after = chat_client.histories.stats() if chat_client else None
+    metrics_after = scrape_metrics(host, port)
+
+    ok = [r for r in results if r.ok]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    history_growth = None
+    if histories_before is not None:
+        history_growth = {
+            k: histories_after[k] - histories_before.get(k, 0)
+            for k, v in histories_after.items() if isinstance(v, (int, float))
+        }
+
+    report = {
+        "config": {
+            "label": args.label,
+            "commit": git_commit(),
+            "server": "external" if args.app_url else args.server,
+            "clients": args.clients,
+            "turns": args.turns,
+            "distinct_questions": len(pool),
+            "ramp": args.ramp,
+            "seed": args.seed,
+            "fake": {
+                "token_rate": args.token_rate, "first_token_delay": args.first_token_delay,
+                "tokens": args.tokens, "stall_prob": args.stall_prob, "stall_seconds": args.stall_seconds,
+                "fail": args.fail,
+            },
+        },
+        "results": {
+            "requests": len(results),
+            "succeeded": len(ok),
+            "errors": errors,
+            "wall_seconds": wall,
+            "requests_per_second": len(results) / wall if wall else None,
+            "chars_per_second": sum(r.chars for r in results) / wall if wall else None,
+            "ttft_seconds": summarize([r.ttft for r in ok if r.ttft is not None]),
+            "total_seconds": summarize([r.total for r in ok]),
+            "frames_per_stream": summarize([float(r.frames) for r in ok]),
+            "heartbeats": sum(r.heartbeats for r in results),
+            "resets": sum(r.resets for r in results),
+            "history": {"before": histories_before, "after": histories_after, "growth": history_growth},
+            "rss_growth_bytes": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+            "model_attempts": counter_delta(metrics_before, metrics_after, "astro_model_attempts_total"),
+            "model_errors": counter_delta(metrics_before, metrics_after, "astro_model_errors_total"),
+            "fallbacks": counter_delta(metrics_before, metrics_after, "astro_fallbacks_total"),
+            "stream_failovers": counter_delta(metrics_before, metrics_after, "astro_stream_failovers_total"),
+            "admissions": counter_delta(metrics_before, metrics_after, "astro_admissions_total"),
+            "model_pacing": counter_delta(metrics_before, metrics_after, "astro_model_pacing_total"),
+            "sse_streams": counter_delta(metrics_before, metrics_after, "astro_sse_streams_total"),
+            "response_cache": counter_delta(metrics_before, metrics_after, "astro_response_cache_events_total"),
+            "single_flight": counter_delta(metrics_before, metrics_after, "astro_single_flight_events_total"),
+            "upstream_calls": {f"{model} {outcome}": n for (model, outcome), n in sorted(fake_config.calls.items())},
+        },
+    }
+
+    res = report["results"]
+    fmt = lambda v: "-" if v is None else f"{v:.3f}"
+    print(f"📊 {res['succeeded']}/{res['requests']} ok in {wall:.1f}s "
+          f"({fmt(res['requests_per_second'])} req/s, {fmt(res['chars_per_second'])} chars/s)", flush=True)
+    for name in ("ttft_seconds", "total_seconds"):
+        s = res[name]
+        print(f"   {name:<14} p50={fmt(s['p50'])} p95={fmt(s['p95'])} p99={fmt(s['p99'])} max={fmt(s['max'])}",
+              flush=True)
+    if errors:
+        print(f"   errors: {errors}", flush=True)
+    if res["fallbacks"]:
+        print(f"   fallbacks: {res['fallbacks']}", flush=True)
+    if history_growth is not None:
+        print(f"   history growth: {history_growth}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"💾 Results written to {args.output}", flush=True)
+
+    if stop_app:
+        stop_app()
+    fake_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import asyncio
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI
+from config.config import *
+from ChatClient import ChatClient
+from prompts.SystemPrompt import SYSTEM_PROMPT
+from cache.ResponseCache import replay_chunks
+from metrics import Metrics as metrics
+from metrics.Metrics import StreamTimer
+from routing.Upstream import async_warm_up
+from streaming.SSE import STREAM_RESET
+
+
+class AsyncChatClient(ChatClient):
+    """asyncio flavour of ChatClient built on openai.AsyncOpenAI.
+
+    Shares conversation management and message building with ChatClient (and
+    the same history backend), but streams with ``async for`` and waits with
+    ``asyncio.sleep`` so one event loop can serve many concurrent streams.
+    History access (which may block on the striped locks or on SQLite) runs
+    in worker threads via ``asyncio.to_thread``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.http_client.close()  # The sync pool built by ChatClient is not used here
+        self.http_client = httpx.AsyncClient(timeout=self._upstream_timeout(), limits=self._upstream_limits())
+        self.client = AsyncOpenAI(
+            base_url= BASE_URL,
+            api_key= API_KEY,
+            http_client=self.http_client,
+            timeout=self._upstream_timeout(),
+            max_retries=UPSTREAM_MAX_RETRIES,
+        )
+        if HEDGE_ENABLED:
+            # The async model loop is sequential fallback only
+            print("⚠️ HEDGE_ENABLED is set but AsyncChatClient (asgi.py) does not hedge; "
+                  "models are tried one after the other", flush=True)
+        if self.flights is not None:
+            # Nor does it coalesce identical questions; keep /metrics from reporting an idle SingleFlight
+            print("⚠️ SINGLE_FLIGHT_ENABLED is set but AsyncChatClient (asgi.py) does not coalesce "
+                  "identical questions", flush=True)
+            self.flights = None
+
+    async def warm_up(self) -> None:
+        """Open UPSTREAM_WARMUP_CONNECTIONS pooled connections; await it on the serving event loop."""
+        await async_warm_up(self.http_client, BASE_URL, UPSTREAM_WARMUP_CONNECTIONS)
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+    async def _aiter_content(self, stream, timer: StreamTimer):
+        """Async twin of ChatClient._iter_content (same stall deadlines)."""
+        watch = self.watchdog.watch(stream, timer.model)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    content = chunk.choices[0].delta.content
+                    timer.chunk(content)
+                    self.watchdog.pause(watch)
+                    yield content
+                    self.watchdog.arm(watch)
+        except Exception as e:
+            if watch.expired:
+                raise watch.error() from e
+            raise
+        finally:
+            self.watchdog.release(watch)
+        if watch.expired:
+            raise watch.error()
+        timer.finish()
+
+    async def chat_with_model_stream(self, question: str, conversation_id: str = "default",
+                                     outcome: Optional[dict] = None):
+        """
+        Async generator with the same fallback semantics as
+        ChatClient.chat_with_model_stream: yields content chunks from the first
+        model (in live health order) that streams successfully. ``outcome``
+        is filled in as there (``model`` and ``source``).
+
+        Raises:
+            RuntimeError: If no configured model returns a non-empty stream.
+            AuthenticationError, BadRequestError: Re-raised immediately.
+        """
+        # Greetings and clearly off-topic questions get their canned reply here
+        canned = await asyncio.to_thread(self._prefilter, question, conversation_id)
+        if canned is not None:
+            if outcome is not None:
+                outcome.update(model=None, source="prefilter")
+            for piece in replay_chunks(canned, RESPONSE_CACHE_REPLAY_CHUNK_CHARS):
+                yield piece
+            await asyncio.to_thread(self._append_turns, conversation_id, {"role": "user", "content": question},
+                                    {"role": "assistant", "content": canned})
+            return
+
+        models = self._model_order()
+        # Build the prompt from the prior turns before recording this one
+        messages = await asyncio.to_thread(self.messageBuilder, question, conversation_id, models)
+
+        # Optimistically record the user turn (the store creates the bucket if needed)
+        user_turn = {"role": "user", "content": question}
+        first_turn = len(messages) == 2 # Just the system prompt and this question
+        await asyncio.to_thread(self._append_turns, conversation_id, user_turn)
+
+        cacheable = first_turn and self.cache is not None
+
+        # First-turn questions may be answered from the response cache
+        cached = self.cache.lookup(question, SYSTEM_PROMPT, models) if cacheable else None
+        if cached is not None:
+            model, answer = cached
+            print(f"\n💾 Cache hit (answer from model: {model})", flush=True)
+            if outcome is not None:
+                outcome.update(model=model, source="cache")
+            for piece in replay_chunks(answer, RESPONSE_CACHE_REPLAY_CHUNK_CHARS):
+                yield piece
+            await asyncio.to_thread(self._append_turns, conversation_id, {"role": "assistant", "content": answer})
+            return
+
+        success = False # Flag to track if any model succeeded
+        assistant_reply_collected = []  # Collect streamed chunks for history
+        paced_out = []  # Retry-after of each model skipped by pacing
+
+        try:
+            for model in models:
+                wait = self._pace(model, paced_out)
+                if wait is None:
+                    continue
+                await asyncio.sleep(wait)
+                content_yielded = False
+                try:
+                    print(f"\n🔄 Trying model: {model}" + (" (continuing)" if assistant_reply_collected else ""),
+                          flush=True)
+                    if self.health is not None:
+                        self.health.record_attempt(model)
+                    timer = StreamTimer(model)
+                    stream = await self.client.chat.completions.create(
+                        model=model,
+                        messages=self._resume_messages(messages, assistant_reply_collected),
+                        stream=True,
+                    )
+
+                    contents = self._aiter_content(stream, timer)
+                    try:
+                        async for content in contents:
+                            yield content
+                            assistant_reply_collected.append(content)
+                            content_yielded = True
+                    finally:
+                        await contents.aclose()
+
+                    if content_yielded:
+                        print(f"\n✅ Stream finished for model: {model}", flush=True)
+                        if self.health is not None:
+                            self.health.record_success(model, timer.ttft)
+                        self._record_answer(model, models)
+                        if outcome is not None:
+                            outcome.update(model=model, source="upstream")
+                        success = True
+                        break
+                    else:
+                        print(f"⚠️ Model {model} returned an empty stream.", flush=True)
+                        metrics.MODEL_ATTEMPTS.inc(model, "empty")
+                        if self.health is not None:
+                            self.health.record_failure(model)
+
+                except Exception as e:
+                    # Same logging/re-raise/backoff/health policy as ChatClient
+                    backoff = self._handle_model_error(model, e)
+                    if self.health is not None and self.health.record_failure(model, e):
+                        backoff = 0
+                    if content_yielded:
+                        backoff = 0
+                        if self._partial_failover(model, assistant_reply_collected):
+                            yield STREAM_RESET
+                    await asyncio.sleep(backoff)
+                finally:
+                    # A disconnect (CancelledError) must not leave a half-open probe claimed
+                    if self.health is not None:
+                        self.health.release(model)
+        finally:
+            # Runs on success, on failure and when the client disconnects
+            # (task cancellation), so history never keeps a dangling user turn.
+            assistant_text = "".join(assistant_reply_collected)
+
+            def store_turn():
+                if success and assistant_text:
+                    self._append_answer(conversation_id, user_turn, assistant_text)
+                elif not success:
+                    with self.histories.lock(conversation_id):
+                        self.histories.pop_last(conversation_id, user_turn)
+
+            # Completes in its thread even if this task is cancelled again meanwhile
+            await asyncio.to_thread(store_turn)
+            if success and assistant_text and cacheable:
+                self.cache.store(question, SYSTEM_PROMPT, model, assistant_text)
+
+        if not success:
+            raise self._no_answer_error(models, paced_out)
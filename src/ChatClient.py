@@ -1,48 +1,343 @@
 import openai # Import the base library first
 from openai import OpenAI, APIError, RateLimitError, APIConnectionError, AuthenticationError, NotFoundError, BadRequestError, PermissionDeniedError # Import specific exceptions
-from prompts.SystemPrompt import SYSTEM_PROMPT
+from prompts.SystemPrompt import SYSTEM_PROMPT, CANNED_REPLIES
 from config.config import *
+from history.HistoryBackend import create_history_store
+from routing.Hedging import HedgedStream
+from routing.ModelHealth import ModelHealth
+from routing.DomainFilter import DomainFilter
+from admission.AdmissionControl import AdmissionRejected
+from admission.RateLimiter import KeyedRateLimiter
+from routing.Upstream import StallWatchdog, StreamStalled, upstream_limits, upstream_timeout, warm_up
+from cache.ResponseCache import ResponseCache, replay_chunks
+from cache.SingleFlight import SingleFlight
+from metrics import Metrics as metrics
+from metrics.Metrics import StreamTimer
+from prompts.PromptBudget import PromptBudget, estimate_tokens, message_tokens, summarize_turns
+from streaming.SSE import STREAM_RESET
+import httpx
 import traceback # For unexpected errors
-from typing import Dict, List, Optional
+from typing import List, Optional
 import time
 
 
 class ChatClient:
     def __init__(self):
+        # One pooled keep-alive HTTP client for every upstream request
+        self.http_client = httpx.Client(timeout=self._upstream_timeout(), limits=self._upstream_limits())
         self.client = OpenAI(
             base_url= BASE_URL,
-            api_key= API_KEY
+            api_key= API_KEY,
+            http_client=self.http_client,
+            timeout=self._upstream_timeout(),
+            max_retries=UPSTREAM_MAX_RETRIES,
         )
-        # In-memory conversation stores: {conversation_id: [ {role, content}, ... ]}
+        # Aborts model streams that miss their first-token or stall deadline
+        self.watchdog = StallWatchdog(UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS, UPSTREAM_STALL_TIMEOUT_SECONDS)
+        # Conversation store: {conversation_id: [ {role, content}, ... ]}, either
+        # bounded in-memory or shared SQLite depending on HISTORY_BACKEND.
         # Only user/assistant messages are stored; system prompt is applied per request.
-        self.histories: Dict[str, List[dict]] = {}
+        self.histories = create_history_store()
+        # Live per-model health (EWMA TTFT, error rate, circuit breakers) that
+        # decides the order in which CHATBOT_MODELS are tried.
+        self.health = ModelHealth(
+            alpha=MODEL_HEALTH_EWMA_ALPHA,
+            failure_threshold=MODEL_CIRCUIT_FAILURE_THRESHOLD,
+            base_cooldown=MODEL_CIRCUIT_COOLDOWN_SECONDS,
+            max_cooldown=MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS,
+        ) if MODEL_HEALTH_ENABLED else None
+        # Opt-in cache of complete answers to first-turn questions
+        self.cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=RESPONSE_CACHE_TTL_SECONDS,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES,
+        ) if RESPONSE_CACHE_ENABLED else None
+        # Coalesces concurrent identical first-turn questions onto one upstream stream
+        self.flights = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+        # Spreads upstream calls to stay under each model's request rate limit
+        self.pacer = KeyedRateLimiter(
+            {model: rate / 60.0 for model, rate in MODEL_RATE_LIMITS.items()},
+            default_rate=DEFAULT_MODEL_RATE_PER_MINUTE / 60.0,
+            burst=MODEL_PACING_BURST,
+        ) if MODEL_PACING_ENABLED else None
+        # Answers greetings and clearly off-topic questions without a model call
+        self.domain_filter = DomainFilter(
+            threshold=DOMAIN_FILTER_THRESHOLD,
+            max_words=DOMAIN_FILTER_MAX_WORDS,
+            extra_astronomy_terms=DOMAIN_FILTER_ASTRONOMY_TERMS,
+        ) if DOMAIN_FILTER_ENABLED else None
+
+    @staticmethod
+    def _upstream_timeout() -> httpx.Timeout:
+        return upstream_timeout(UPSTREAM_CONNECT_TIMEOUT_SECONDS, UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS,
+                                UPSTREAM_STALL_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def _upstream_limits() -> httpx.Limits:
+        return upstream_limits(UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                               UPSTREAM_KEEPALIVE_EXPIRY_SECONDS)
+
+    def warm_up(self) -> None:
+        """Open UPSTREAM_WARMUP_CONNECTIONS pooled connections to the API ahead of the first question."""
+        warm_up(self.http_client, BASE_URL, UPSTREAM_WARMUP_CONNECTIONS)
 
     # --- Conversation management helpers ---
     def start_conversation(self, conversation_id: str = "default") -> None:
-        if conversation_id not in self.histories:
-            self.histories[conversation_id] = []
+        self.histories.start(conversation_id)
 
     def clear_conversation(self, conversation_id: str = "default") -> None:
-        self.histories.pop(conversation_id, None)
+        self.histories.clear(conversation_id)
 
     def get_history(self, conversation_id: str = "default") -> List[dict]:
-        return list(self.histories.get(conversation_id, []))
+        return self.histories.get(conversation_id)
 
+    def stats(self) -> dict:
+        """Snapshot of history store, response cache, single-flight and model health counters."""
+        return {
+            "histories": self.histories.stats(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "flights": self.flights.stats() if self.flights is not None else None,
+            "models": self.health.stats() if self.health is not None else None,
+        }
 
-    def messageBuilder(self, question: str, conversation_id: str = "default") -> list:
+
+    def messageBuilder(self, question: str, conversation_id: str = "default", models: Optional[List[str]] = None) -> list:
         """Build the message list for the API call including history.
 
         The system prompt is added fresh each call. History is retrieved from
         memory for the given conversation and contains only prior user/assistant
         turns. The current user message is appended at the end.
+
+        History is kept within the smallest prompt budget among ``models``
+        (MODEL_CONTEXT_BUDGETS): once it passes the compaction threshold, the
+        oldest turns are folded into the conversation's rolling summary, which
+        is sent as a second system message ahead of the remaining turns.
         """
-        prior = self.histories.get(conversation_id, [])
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        system = {"role": "system", "content": SYSTEM_PROMPT}
+        current = {"role": "user", "content": question}
+        with self.histories.lock(conversation_id):
+            prior = self.histories.get(conversation_id)
+            summary = self.histories.get_summary(conversation_id)
+            fixed = message_tokens(system) + message_tokens(current) + estimate_tokens(summary or "")
+            old, prior = self._prompt_budget(models or CHATBOT_MODELS).split(fixed, prior)
+            if old:
+                summary = summarize_turns(summary, old, PROMPT_SUMMARY_MAX_TOKENS)
+                self.histories.compact(conversation_id, len(old), summary)
+                print(f"🗜️ Compacted {len(old)} old messages into the conversation summary", flush=True)
+
+        messages = [system]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
         messages.extend(prior)
-        messages.append({"role": "user", "content": question})
+        messages.append(current)
         return messages
 
-    def chat_with_model_stream(self, question: str, conversation_id: str = "default"):
+    @staticmethod
+    def _prompt_budget(models: List[str]) -> PromptBudget:
+        budget = min(MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET) for model in models)
+        return PromptBudget(
+            budget,
+            reply_reserve=PROMPT_REPLY_RESERVE_TOKENS,
+            compact_threshold=PROMPT_COMPACT_THRESHOLD,
+            compact_target=PROMPT_COMPACT_TARGET,
+            keep_recent=PROMPT_KEEP_RECENT_MESSAGES,
+        )
+
+    def _model_order(self) -> List[str]:
+        """CHATBOT_MODELS in the order to try them for the next request."""
+        if self.health is None:
+            return list(CHATBOT_MODELS)
+        return self.health.order(CHATBOT_MODELS)
+
+    def _pace(self, model: str, paced_out: Optional[List[float]] = None) -> Optional[float]:
+        """Seconds to wait before calling ``model`` so we stay under its
+        request rate, or None to skip it for this request (its retry-after
+        is then appended to ``paced_out``)."""
+        if self.pacer is None:
+            return 0.0
+        ok, wait = self.pacer.reserve(model, MODEL_PACING_MAX_WAIT_SECONDS)
+        if not ok:
+            print(f"🚦 Model {model} is at its request rate; skipping it (budget back in {wait:.1f}s)", flush=True)
+            metrics.MODEL_PACING.inc(model, "skipped")
+            if paced_out is not None:
+                paced_out.append(wait)
+            return None
+        if wait:
+            print(f"🚦 Pacing model {model}: waiting {wait:.2f}s", flush=True)
+            metrics.MODEL_PACING.inc(model, "delayed")
+        return wait
+
+    @staticmethod
+    def _no_answer_error(models: List[str], paced_out: List[float]) -> Exception:
+        """The error to raise when no model answered. If every model was
+        skipped by pacing nothing actually failed: report it as busy, with
+        the time until the earliest model has budget again."""
+        if models and len(paced_out) >= len(models):
+            return AdmissionRejected(
+                "model_pacing",
+                "All models are at their request rate limit. Please try again shortly.",
+                min(paced_out),
+            )
+        return RuntimeError("Failed to get a response from any configured model.")
+
+    def _prefilter(self, question: str, conversation_id: str) -> Optional[str]:
+        """Canned reply for a question the local prefilter is confident
+        about, or None to send it to the models."""
+        if self.domain_filter is None:
+            return None
+        decision = self.domain_filter.classify(question)
+        if decision.answered and decision.label == "out_of_domain" and self.histories.get(conversation_id):
+            # Only read the history when it matters: a follow-up is the model's call
+            decision = self.domain_filter.classify(question, follow_up=True)
+        route = "local" if decision.answered else "upstream"
+        metrics.PREFILTER_DECISIONS.inc(decision.label, route)
+        if decision.label != "astronomy":
+            hits = {k: v for k, v in decision.hits.items() if v}
+            print(f"🧭 Prefilter: {decision.label} ({decision.confidence:.2f}) -> {route} {hits} "
+                  f"{question[:80]!r}", flush=True)
+        return CANNED_REPLIES[decision.label] if decision.answered else None
+
+    def _answer_locally(self, question: str, conversation_id: str, answer: str, outcome: Optional[dict]):
+        """Stream a prefilter reply and record the exchange like a model answer."""
+        if outcome is not None:
+            outcome.update(model=None, source="prefilter")
+        for piece in replay_chunks(answer, RESPONSE_CACHE_REPLAY_CHUNK_CHARS):
+            yield piece
+        self._append_turns(conversation_id, {"role": "user", "content": question},
+                           {"role": "assistant", "content": answer})
+
+    def _append_turns(self, conversation_id: str, *messages: dict) -> None:
+        with self.histories.lock(conversation_id):
+            self.histories.append(conversation_id, *messages)
+
+    def _append_answer(self, conversation_id: str, user_turn: dict, answer: str) -> bool:
+        """Record ``answer`` after ``user_turn``, unless a newer turn has been
+        recorded since (this generation was abandoned for a newer question)."""
+        with self.histories.lock(conversation_id):
+            history = self.histories.get(conversation_id)
+            if not history or history[-1] != user_turn:
+                print("🧵 A newer turn was recorded meanwhile; not storing this answer", flush=True)
+                return False
+            self.histories.append(conversation_id, {"role": "assistant", "content": answer})
+            return True
+
+    def _open_model_stream(self, model: str, messages: list):
+        """Open a streaming chat completion for one model."""
+        return self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+        )
+
+    @staticmethod
+    def _resume_messages(messages: list, partial: List[str]) -> list:
+        """``messages`` plus the partial answer of a model that failed
+        mid-stream, as an assistant prefill for the next model to continue."""
+        if not partial:
+            return messages
+        return messages + [{"role": "assistant", "content": "".join(partial)}]
+
+    def _iter_content(self, stream, timer: Optional[StreamTimer] = None):
+        """Yield the non-empty content deltas of a completion stream, timing
+        them with ``timer`` (TTFT, inter-chunk gaps, duration) when given.
+
+        Raises StreamStalled when the first token or the next chunk does not
+        arrive in time (only time spent waiting on upstream counts).
+        """
+        watch = self.watchdog.watch(stream, timer.model if timer is not None else "model")
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    content = chunk.choices[0].delta.content
+                    if timer is not None:
+                        timer.chunk(content)
+                    self.watchdog.pause(watch)
+                    yield content
+                    self.watchdog.arm(watch)
+        except Exception as e:
+            if watch.expired:
+                raise watch.error() from e
+            raise
+        finally:
+            self.watchdog.release(watch)
+        if watch.expired:  # The aborted response may also just end early
+            raise watch.error()
+        if timer is not None:
+            timer.finish()
+
+    @staticmethod
+    def _partial_failover(model: str, partial: List[str]) -> bool:
+        """Decide how the next model picks up after ``model`` failed with
+        ``partial`` already streamed. Returns True if the client must be sent
+        STREAM_RESET (``partial`` is then cleared)."""
+        metrics.STREAM_FAILOVERS.inc(STREAM_FAILOVER_MODE)
+        if STREAM_FAILOVER_MODE == "reset":
+            print(f"↩️ Model {model} failed mid-answer; resetting the partial answer", flush=True)
+            partial.clear()
+            return True
+        print(f"↪️ Model {model} failed mid-answer; the next model continues it", flush=True)
+        return False
+
+    @staticmethod
+    def _record_answer(model: str, models: List[str]) -> None:
+        """Count a successful attempt (and a fallback if it was not the first choice)."""
+        metrics.MODEL_ATTEMPTS.inc(model, "success")
+        if models and model != models[0]:
+            metrics.FALLBACKS.inc(model)
+
+    def _handle_model_error(self, model: str, e: BaseException) -> float:
+        """Log a failed model attempt.
+
+        Re-raises errors that should stop all attempts (authentication, bad
+        request). Otherwise returns how many seconds to wait before trying the
+        next model.
+        """
+        metrics.MODEL_ATTEMPTS.inc(model, "error")
+        metrics.MODEL_ERRORS.inc(model, type(e).__name__)
+        # --- Specific OpenAI Error Handling ---
+        if isinstance(e, AuthenticationError):
+            print(f"❌ Authentication Error with model {model}: {e}", flush=True)
+            print("   Check API key/permissions. Stopping attempts.", flush=True)
+            raise e # Re-raise critical errors like auth failure to stop execution
+        if isinstance(e, PermissionDeniedError):
+            print(f"❌ Permission Denied for model {model}: {e}", flush=True)
+            return 0 # Continue to the next model
+        if isinstance(e, NotFoundError):
+            print(f"❌ Model Not Found Error: '{model}'. {e}", flush=True)
+            return 0 # Continue loop to try the next model
+        if isinstance(e, RateLimitError):
+            print(f"⏳ Rate Limit Error for model {model}: {e}. Waiting...", flush=True)
+            return 5 # Wait longer for rate limit errors
+        if isinstance(e, StreamStalled):
+            print(f"⏱️ Stream stalled for model {model}: {e}. Trying the next model...", flush=True)
+            return 0 # Already waited long enough
+        if isinstance(e, APIConnectionError):
+            print(f"🌐 API Connection Error with model {model}: {e}. Retrying...", flush=True)
+            return 2
+        if isinstance(e, httpx.TimeoutException): # Socket-level backstop of the stall deadlines
+            print(f"⏱️ Upstream read timed out for model {model}: {e}. Trying the next model...", flush=True)
+            return 0
+        if isinstance(e, httpx.TransportError): # Raised directly while reading a stream
+            print(f"🌐 Connection to model {model} broke mid-stream: {e}", flush=True)
+            return 2
+        if isinstance(e, BadRequestError):
+            print(f"👎 Bad Request Error with model {model}: {e}", flush=True)
+            if hasattr(e, 'body') and e.body:
+                print(f"   Error details: {e.body}", flush=True)
+            print("   Stopping attempts due to potential data issue.", flush=True)
+            raise e # Re-raise, likely unrecoverable for this request
+        if isinstance(e, APIError): # Catch other OpenAI API specific errors
+            print(f"⚠️ OpenAI API Error with model {model}: {type(e).__name__} - {e}", flush=True)
+            return 1
+        # --- General Error Handling ---
+        print(f"💥 Unexpected error with model {model}: {type(e).__name__} - {e}", flush=True)
+        print("--- Traceback ---", flush=True)
+        traceback.print_exception(e)
+        print("--- End Traceback ---", flush=True)
+        return 1
+
+    def chat_with_model_stream(self, question: str, conversation_id: str = "default",
+                               outcome: Optional[dict] = None):
         """
         Attempts to get a streaming chat completion from configured models.
 
@@ -52,6 +347,10 @@ class ChatClient:
 
         Args:
             question (str): The user's question.
+            conversation_id (str): Conversation whose history gives context.
+            outcome (dict, optional): Filled in with ``model`` (the model that
+                answered) and ``source`` ("upstream", "cache", "prefilter", or
+                "shared" when joined to an identical in-flight question).
 
         Yields:
             str: Chunks of the response content from the model.
@@ -62,94 +361,174 @@ class ChatClient:
             # Specific OpenAI exceptions might bubble up if not caught or if re-raised
             # (e.g., AuthenticationError, BadRequestError are re-raised by default here).
         """
-        # Ensure a conversation bucket exists and optimistically record the user turn
-        self.start_conversation(conversation_id)
-        self.histories[conversation_id].append({"role": "user", "content": question})
+        # Greetings and clearly off-topic questions get their canned reply here
+        canned = self._prefilter(question, conversation_id)
+        if canned is not None:
+            yield from self._answer_locally(question, conversation_id, canned, outcome)
+            return
+
+        models = self._model_order()
+        # Build the prompt from the prior turns before recording this one
+        messages = self.messageBuilder(question, conversation_id, models)
+
+        # Optimistically record the user turn (the store creates the bucket if needed)
+        user_turn = {"role": "user", "content": question}
+        with self.histories.lock(conversation_id):
+            first_turn = len(messages) == 2 # Just the system prompt and this question
+            self.histories.append(conversation_id, user_turn)
+
+        cacheable = first_turn and self.cache is not None
+
+        # First-turn questions may be answered from the response cache
+        cached = self.cache.lookup(question, SYSTEM_PROMPT, models) if cacheable else None
+        if cached is not None:
+            model, answer = cached
+            print(f"\n💾 Cache hit (answer from model: {model})", flush=True)
+            if outcome is not None:
+                outcome.update(model=model, source="cache")
+            for piece in replay_chunks(answer, RESPONSE_CACHE_REPLAY_CHUNK_CHARS):
+                yield piece
+            with self.histories.lock(conversation_id):
+                self.histories.append(conversation_id, {"role": "assistant", "content": answer})
+            return
 
-        messages = self.messageBuilder(question, conversation_id)
-        success = False # Flag to track if any model succeeded
         assistant_reply_collected = []  # Collect streamed chunks for history
+        outcome = {} if outcome is None else outcome # _stream_models fills in the model that answered
+        outcome["source"] = "upstream"
+
+        if first_turn and self.flights is not None:
+            # Identical in-flight first-turn questions share one upstream
+            # generation; late joiners get the already-streamed prefix replayed.
+            source, leader = self.flights.subscribe(
+                SingleFlight.key(question, SYSTEM_PROMPT),
+                lambda: self._stream_models(messages, models, outcome),
+                outcome,
+            )
+            if not leader:
+                outcome["source"] = "shared"
+        else:
+            source, leader = self._stream_models(messages, models, outcome), True
+
+        try:
+            for content in source:
+                yield content # <-- YIELD the content chunk
+                if content is STREAM_RESET:
+                    assistant_reply_collected.clear() # The next model starts over
+                else:
+                    assistant_reply_collected.append(content)
+        except BaseException:
+            # If all models failed (or a critical error stopped them, or the
+            # generator was closed), roll back the last user turn for a clean history
+            with self.histories.lock(conversation_id):
+                self.histories.pop_last(conversation_id, user_turn)
+            raise
+
+        # A model succeeded: store the assistant reply
+        assistant_text = "".join(assistant_reply_collected)
+        self._append_answer(conversation_id, user_turn, assistant_text)
+        if cacheable and leader:
+            self.cache.store(question, SYSTEM_PROMPT, outcome["model"], assistant_text)
+
+    def _stream_models(self, messages: list, models: List[str], outcome: dict):
+        """Yield content from the first model in ``models`` that streams
+        successfully (sequential fallback, or hedged when HEDGE_ENABLED).
+
+        A model that fails after streaming part of the answer is followed by
+        the next one, which continues the partial answer or starts over after
+        a STREAM_RESET, depending on STREAM_FAILOVER_MODE.
+
+        Sets ``outcome["model"]`` to the model that answered. Raises
+        RuntimeError if no model produced any content, or AdmissionRejected
+        if pacing skipped every model.
+        """
+        partial: List[str] = []  # Content already streamed to the client
+        paced_out: List[float] = []  # Retry-after of each model skipped by pacing
+        if HEDGE_ENABLED and len(models) > 1:
+            # Race models: start the next one if the current has not produced
+            # a first token within HEDGE_DELAY_SECONDS, keep whichever wins.
+            hedged = HedgedStream(
+                models,
+                open_stream=lambda model: self._open_model_stream(model, messages),
+                iter_content=self._iter_content,
+                on_error=self._handle_model_error,
+                hedge_delay=HEDGE_DELAY_SECONDS,
+                max_parallel=HEDGE_MAX_PARALLEL,
+                health=self.health,
+                pace=lambda model: self._pace(model, paced_out),
+            )
+            for model, content in hedged:
+                yield content
+                partial.append(content)
+            if hedged.winner is not None:
+                print(f"\n✅ Stream finished for model: {hedged.winner}", flush=True)
+                self._record_answer(hedged.winner, models)
+                outcome["model"] = hedged.winner
+                return
+            if not partial:
+                raise self._no_answer_error(models, paced_out)
+            # The winner died mid-answer: carry on sequentially with the models
+            # the race has not called yet (the others already failed or lost)
+            if self._partial_failover(hedged.interrupted, partial):
+                yield STREAM_RESET
+            attempted = set(hedged.attempted)
+            models = [m for m in models if m not in attempted]
 
-        for model in CHATBOT_MODELS:
+        for model in models:
+            wait = self._pace(model, paced_out)
+            if wait is None:
+                continue
+            time.sleep(wait)
+            content_yielded = False
             try:
                 # Print status messages to stderr or use logging
-                print(f"\n🔄 Trying model: {model}", flush=True)
-                stream = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    stream=True,
-                    # Consider adding a timeout
-                    # timeout=30.0 # Example: 30 seconds timeout
-                )
-
-                content_yielded = False
+                print(f"\n🔄 Trying model: {model}" + (" (continuing)" if partial else ""), flush=True)
+                if self.health is not None:
+                    self.health.record_attempt(model)
+                timer = StreamTimer(model)
+                stream = self._open_model_stream(model, self._resume_messages(messages, partial))
+
                 # Iterate through the stream and yield content chunks
-                for chunk in stream:
-                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        yield content # <-- YIELD the content chunk
-                        assistant_reply_collected.append(content)
-                        content_yielded = True
+                for content in self._iter_content(stream, timer):
+                    yield content
+                    partial.append(content)
+                    content_yielded = True
 
                 # If we successfully processed the stream (even if it was empty), mark success
                 if content_yielded:
                     print(f"\n✅ Stream finished for model: {model}", flush=True) # Status print
-                    success = True
-                    break # Success, stop trying other models
+                    if self.health is not None:
+                        self.health.record_success(model, timer.ttft)
+                    self._record_answer(model, models)
+                    outcome["model"] = model
+                    return # Success, stop trying other models
                 else:
                     # Handle case where stream completed but yielded no content
                     print(f"⚠️ Model {model} returned an empty stream.", flush=True)
+                    metrics.MODEL_ATTEMPTS.inc(model, "empty")
+                    if self.health is not None:
+                        self.health.record_failure(model)
                     # Continue loop to try the next model
-
-            # --- Specific OpenAI Error Handling ---
-            except AuthenticationError as e:
-                print(f"❌ Authentication Error with model {model}: {e}", flush=True)
-                print("   Check API key/permissions. Stopping attempts.", flush=True)
-                raise # Re-raise critical errors like auth failure to stop execution
-            except PermissionDeniedError as e:
-                print(f"❌ Permission Denied for model {model}: {e}", flush=True)
-                # Continue to the next model
-            except NotFoundError as e:
-                print(f"❌ Model Not Found Error: '{model}'. {e}", flush=True)
-                # Continue loop to try the next model
-            except RateLimitError as e:
-                print(f"⏳ Rate Limit Error for model {model}: {e}. Waiting...", flush=True)
-                time.sleep(5) # Wait longer for rate limit errors
-            except APIConnectionError as e:
-                print(f"🌐 API Connection Error with model {model}: {e}. Retrying...", flush=True)
-                time.sleep(2)
-            except BadRequestError as e:
-                print(f"👎 Bad Request Error with model {model}: {e}", flush=True)
-                if hasattr(e, 'body') and e.body:
-                    print(f"   Error details: {e.body}", flush=True)
-                print("   Stopping attempts due to potential data issue.", flush=True)
-                raise # Re-raise, likely unrecoverable for this request
-            except APIError as e: # Catch other OpenAI API specific errors
-                print(f"⚠️ OpenAI API Error with model {model}: {type(e).__name__} - {e}", flush=True)
-                time.sleep(1)
-            # --- General Error Handling ---
             except Exception as e:
-                print(f"💥 Unexpected error with model {model}: {type(e).__name__} - {e}", flush=True)
-                print("--- Traceback ---", flush=True)
-                traceback.print_exc()
-                print("--- End Traceback ---", flush=True)
-                time.sleep(1)
-
-        # After the loop, if a model succeeded, store assistant reply
-        if success:
-            assistant_text = "".join(assistant_reply_collected)
-            if assistant_text:
-                self.histories[conversation_id].append({"role": "assistant", "content": assistant_text})
-        else:
-            # If all models failed, roll back the last user turn for a clean history
-            hist = self.histories.get(conversation_id)
-            if hist and hist[-1].get("role") == "user" and hist[-1].get("content") == question:
-                try:
-                    hist.pop()
-                except Exception:
-                    pass
-            # Raise an exception if all models failed
-            raise RuntimeError("Failed to get a response from any configured model.")
+                # Logs the error, re-raises critical ones, otherwise backs off.
+                # No need to wait once the model's circuit is open: the next
+                # attempt goes to a different model.
+                backoff = self._handle_model_error(model, e)
+                if self.health is not None and self.health.record_failure(model, e):
+                    backoff = 0
+                if content_yielded:
+                    # The client already has part of this answer: no waiting,
+                    # and never repeat what it has seen
+                    backoff = 0
+                    if self._partial_failover(model, partial):
+                        yield STREAM_RESET
+                time.sleep(backoff)
+            finally:
+                # A disconnect (GeneratorExit) must not leave a half-open probe claimed
+                if self.health is not None:
+                    self.health.release(model)
+
+        # Raise an exception if all models failed
+        raise self._no_answer_error(models, paced_out)
 
 # --- Example Usage (Updated) ---
 
@@ -164,6 +543,11 @@ if __name__ == "__main__":
         full_response = ""
         # Iterate through the generator to get the yielded chunks
         for chunk in stream_generator:
+            if chunk is STREAM_RESET:
+                # A model failed mid-answer and the next one starts over
+                print("\n🔁 ", end="", flush=True)
+                full_response = ""
+                continue
             print(chunk, end="", flush=True) # The caller now prints the chunk
             full_response += chunk # Optionally collect the full response
 
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from admission.RateLimiter import RateLimiter
+from metrics import Metrics as metrics
+
+
+class AdmissionRejected(Exception):
+    """A /chat_stream request was turned away before reaching the models."""
+
+    def __init__(self, reason: str, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.reason = reason  # visitor_rate, ip_rate, visitor_streams, queue_full, queue_timeout, model_pacing
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted", "abandoned")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+        self.abandoned = False
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class Ticket:
+    """An admitted stream; ``release()`` (or leaving the ``with`` block)
+    frees its slot for the next queued request. Safe to call twice."""
+
+    __slots__ = ("_controller", "_visitor", "_released")
+
+    def __init__(self, controller: "AdmissionController", visitor: str):
+        self._controller = controller
+        self._visitor = visitor
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self._visitor)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """Admission control in front of /chat_stream.
+
+    A request is checked, cheapest first, against:
+
+    * token buckets per visitor (cid cookie) and per client IP, so one
+      browser or one bot cannot burn the shared upstream quota;
+    * ``max_streams_per_visitor`` concurrent (or queued) streams per visitor;
+    * ``max_streams`` concurrent streams for the whole process. When they
+      are all busy the request waits in a FIFO queue of at most
+      ``max_queue`` entries for up to ``queue_timeout`` seconds.
+
+    Requests that fail a check raise AdmissionRejected right away (or at
+    the queue deadline), which /chat_stream turns into an SSE ``error``
+    event with a ``retry_after`` hint. Limits are per process.
+    """
+
+    def __init__(
+        self,
+        max_streams: int = 32,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        max_streams_per_visitor: int = 2,
+        visitor_rate: float = 0.2,
+        visitor_burst: float = 5,
+        ip_rate: float = 1.0,
+        ip_burst: float = 20,
+    ):
+        self.max_streams = max_streams
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_streams_per_visitor = max_streams_per_visitor
+        self.visitors = RateLimiter(visitor_rate, visitor_burst)
+        self.ips = RateLimiter(ip_rate, ip_burst)
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue: Deque[_Waiter] = deque()
+        self._per_visitor: Dict[str, int] = {}  # Active + queued streams per visitor
+
+    # --- Checks shared by the sync and async paths ---
+
+    def _check(self, visitor: str, ip: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Apply the rate and concurrency limits. Returns None when a slot
+        was taken, or a _Waiter (for ``loop`` if given) that is already
+        queued and must be waited on. Raises AdmissionRejected otherwise."""
+        ok, retry_after = self.ips.reserve(ip)
+        if not ok:
+            raise self._reject("ip_rate", "Too many requests from your network. Please slow down.", retry_after)
+        ok, retry_after = self.visitors.reserve(visitor)
+        if not ok:
+            raise self._reject("visitor_rate", "You are sending questions too quickly. Please wait a moment.",
+                               retry_after)
+        with self._lock:
+            if self._per_visitor.get(visitor, 0) >= self.max_streams_per_visitor:
+                raise self._reject("visitor_streams", "Another answer is still streaming. Please wait for it.", 1.0)
+            if self._active < self.max_streams and not self._queue:
+                self._active += 1
+                self._per_visitor[visitor] = self._per_visitor.get(visitor, 0) + 1
+                metrics.ADMISSIONS.inc("admitted")
+                return None
+            if len(self._queue) >= self.max_queue:
+                raise self._reject("queue_full", "The server is at capacity. Please try again shortly.",
+                                   self.queue_timeout)
+            waiter = _Waiter(loop)
+            self._queue.append(waiter)
+            self._per_visitor[visitor] = self._per_visitor.get(visitor, 0) + 1
+            return waiter
+
+    @staticmethod
+    def _reject(reason: str, message: str, retry_after: float) -> AdmissionRejected:
+        metrics.ADMISSIONS.inc(f"rejected_{reason}")
+        return AdmissionRejected(reason, message, retry_after)
+
+    def _give_up(self, waiter: _Waiter, visitor: str) -> bool:
+        """Leave the queue after a timeout or cancellation. Returns True if
+        the slot was granted in the meantime (the caller then owns it)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            try:
+                self._queue.remove(waiter)
+            except ValueError:
+                pass
+            self._forget(visitor)
+            return False
+
+    def _forget(self, visitor: str) -> None:
+        count = self._per_visitor.get(visitor, 0) - 1
+        if count > 0:
+            self._per_visitor[visitor] = count
+        else:
+            self._per_visitor.pop(visitor, None)
+
+    def _release(self, visitor: str) -> None:
+        with self._lock:
+            self._forget(visitor)
+            # Hand the slot straight to the oldest waiter (FIFO, no thundering herd)
+            while self._queue:
+                waiter = self._queue.popleft()
+                if not waiter.abandoned:
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self._active -= 1
+
+    # --- Entry points ---
+
+    def admit(self, visitor: str, ip: str) -> Ticket:
+        """Admit a request, blocking in the queue if needed. Raises AdmissionRejected."""
+        started = time.monotonic()
+        waiter = self._check(visitor, ip)
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            if not self._give_up(waiter, visitor):
+                raise self._reject("queue_timeout", "The server is busy. Please try again shortly.",
+                                   self.queue_timeout)
+            self._queued(started)
+        return Ticket(self, visitor)
+
+    async def admit_async(self, visitor: str, ip: str) -> Ticket:
+        """asyncio twin of ``admit``: waits on the event loop, not a thread."""
+        started = time.monotonic()
+        waiter = self._check(visitor, ip, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                # Client went away while queued: do not leak a granted slot
+                if self._give_up(waiter, visitor):
+                    self._release(visitor)
+                raise
+            if not self._give_up(waiter, visitor):
+                raise self._reject("queue_timeout", "The server is busy. Please try again shortly.",
+                                   self.queue_timeout)
+            self._queued(started)
+        return Ticket(self, visitor)
+
+    @staticmethod
+    def _queued(started: float) -> None:
+        metrics.ADMISSIONS.inc("queued")
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": self._active, "queued": len(self._queue), "visitors": len(self._per_visitor)}
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+
+class RateLimiter:
+    """Token buckets keyed by string (visitor id, client IP, model...).
+
+    Every key gets a bucket of ``burst`` tokens refilled at ``rate`` tokens
+    per second. Buckets of the ``max_keys`` least recently seen keys are
+    dropped first, so memory stays bounded whatever clients send; a dropped
+    key simply starts again with a full bucket. ``rate <= 0`` disables the
+    limiter (every request is granted).
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, max_wait: float = 0.0) -> Tuple[bool, float]:
+        """Take one token for ``key``.
+
+        Returns ``(True, wait)`` when a token is granted, ``wait`` being how
+        long the caller must wait before using it (0.0 if one was available,
+        at most ``max_wait``). Returns ``(False, retry_after)`` without taking
+        anything when the wait would be longer than ``max_wait``.
+        """
+        if self.rate <= 0:
+            return True, 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            wait = max(0.0, (1.0 - bucket[0]) / self.rate)
+            if wait > max_wait:
+                return False, wait
+            bucket[0] -= 1.0  # May go negative: later callers queue behind this reservation
+            return True, wait
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class KeyedRateLimiter:
+    """One RateLimiter per key with its own rate, e.g. requests per minute
+    per upstream model (``rates``), falling back to ``default_rate``."""
+
+    def __init__(self, rates: Dict[str, float], default_rate: float, burst: float):
+        self.rates = dict(rates)
+        self.default_rate = default_rate
+        self.burst = burst
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, max_wait: float = 0.0) -> Tuple[bool, float]:
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = RateLimiter(self.rates.get(key, self.default_rate), self.burst, 1)
+        return limiter.reserve(key, max_wait)
@@ -0,0 +1,110 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a question for cache keys: Unicode-normalised,
+    case-folded, whitespace collapsed and trailing punctuation dropped, so
+    "How far is the Moon?" and "how far is the moon" share an entry."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+def replay_chunks(text: str, size: int = 64) -> Iterator[str]:
+    """Split a stored answer into stream-sized chunks, breaking after
+    whitespace where possible so the client sees whole words."""
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            space = text.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield text[start:end]
+        start = end
+
+
+class ResponseCache:
+    """LRU + TTL cache of complete answers to first-turn questions.
+
+    Entries are keyed on the normalised question, the system prompt and the
+    model that produced the answer, so changing SYSTEM_PROMPT or the model
+    list never serves a stale answer. Bounded by entry count and total
+    answer bytes; expired entries are dropped on lookup.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, max_bytes: int = 8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(question: str, system_prompt: str, model: str) -> str:
+        raw = "\x00".join((normalize_question(question), system_prompt, model))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        answer, _ = self._entries.pop(key)
+        self._bytes -= len(answer.encode("utf-8"))
+
+    def lookup(self, question: str, system_prompt: str, models: List[str]) -> Optional[Tuple[str, str]]:
+        """Return ``(model, answer)`` for the first model in ``models`` with a
+        fresh cached answer, or None. Counts one hit or miss per call."""
+        now = time.monotonic()
+        with self._lock:
+            for model in models:
+                key = self.key(question, system_prompt, model)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                answer, stored_at = entry
+                if self.ttl and now - stored_at > self.ttl:
+                    self._drop(key)
+                    self.evictions += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return model, answer
+            self.misses += 1
+            return None
+
+    def store(self, question: str, system_prompt: str, model: str, answer: str) -> None:
+        size = len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        key = self.key(question, system_prompt, model)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (answer, time.monotonic())
+            self._bytes += size
+            self.stores += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
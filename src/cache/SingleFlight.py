@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache.ResponseCache import normalize_question
+
+
+class _Flight:
+    """One upstream generation and everything it has emitted so far."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.meta: dict = {}  # Leader's outcome details, copied to followers
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Share one upstream generation between identical concurrent requests.
+
+    The first request for a key becomes the leader: its generator is run on a
+    background thread that appends every chunk to the flight's buffer.
+    Every subscriber (leader included) reads from that buffer, so a request
+    that joins late first receives the prefix already emitted and then
+    follows live. If the generation fails, every subscriber gets the same
+    exception. When the last subscriber goes away before the end, the
+    upstream stream is abandoned.
+
+    A flight is forgotten as soon as it finishes; later requests start a new
+    one (or are answered by the response cache).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self.started = 0
+        self.joined = 0
+
+    @staticmethod
+    def key(question: str, system_prompt: str) -> str:
+        raw = "\x00".join((normalize_question(question), system_prompt))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def subscribe(self, key: str, start: Callable[[], Iterable[str]],
+                  meta: Optional[dict] = None) -> Tuple[Iterator[str], bool]:
+        """Attach to the flight for ``key``, starting it with ``start()`` if
+        none is in progress. Returns ``(chunks, is_leader)``.
+
+        ``meta`` is a dict the leader's generation fills in (e.g. the model
+        that answered); a follower's ``meta`` receives the leader's entries
+        it does not have yet once the flight ends."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                if meta is not None:
+                    flight.meta = meta
+                self.started += 1
+            else:
+                self.joined += 1
+                print("🔗 Joining in-flight generation for identical question", flush=True)
+            with flight.cond:
+                flight.subscribers += 1
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, start), daemon=True).start()
+        return self._follow(flight, None if leader else meta), leader
+
+    def _produce(self, key: str, flight: _Flight, start: Callable[[], Iterable[str]]) -> None:
+        source = start()
+        try:
+            for chunk in source:
+                with flight.cond:
+                    if flight.subscribers == 0:
+                        print("✂️ All subscribers left; abandoning upstream generation", flush=True)
+                        flight.error = RuntimeError("Generation abandoned: no subscribers left.")
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _follow(self, flight: _Flight, meta: Optional[dict] = None) -> Iterator[str]:
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.chunks) and not flight.done:
+                        flight.cond.wait()
+                    pending = flight.chunks[index:]
+                    index += len(pending)
+                    finished = flight.done and index >= len(flight.chunks)
+                for chunk in pending:
+                    yield chunk
+                if finished:
+                    break
+            if meta is not None:
+                for name, value in flight.meta.items():
+                    meta.setdefault(name, value)
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            with flight.cond:
+                flight.subscribers -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._flights), "started": self.started, "joined": self.joined}
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -53,6 +54,164 @@ CHATBOT_MODELS = [
     "nvidia/llama-3.1-nemotron-ultra-253b-v1:free",
 ]
 
+# Conversation history limits (in-memory store). Idle conversations are
+# evicted after HISTORY_IDLE_TTL_SECONDS; the least recently used ones go first
+# once the conversation or byte caps are reached. HISTORY_MAX_TURNS caps the
+# number of stored messages per conversation; older ones are folded into the
+# conversation's rolling summary (see PROMPT_* below) rather than dropped.
+HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", "10000"))
+HISTORY_IDLE_TTL_SECONDS = float(os.getenv("HISTORY_IDLE_TTL_SECONDS", "3600"))
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "40"))
+HISTORY_LOCK_STRIPES = int(os.getenv("HISTORY_LOCK_STRIPES", "64"))
+
+# History backend: "memory" (per process) or "sqlite" (shared between worker
+# processes and persistent across restarts). The SQLite backend batches
+# appends and commits them every HISTORY_FLUSH_INTERVAL_SECONDS or once
+# HISTORY_BATCH_SIZE messages are pending.
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "memory").strip().lower()
+HISTORY_DB_PATH = os.getenv(
+    "HISTORY_DB_PATH", str(Path(__file__).resolve().parents[2] / "histories.db")
+)
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "0.05"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "64"))
+
+# Upstream HTTP client: one pooled keep-alive httpx client per process, with
+# UPSTREAM_WARMUP_CONNECTIONS opened at startup. A model stream must connect
+# within UPSTREAM_CONNECT_TIMEOUT_SECONDS, send its first content token within
+# UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS and then never go quiet for longer than
+# UPSTREAM_STALL_TIMEOUT_SECONDS, otherwise the next model takes over. The SDK's
+# own retries are off by default because the model fallback already retries.
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5"))
+UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS", "30"))
+UPSTREAM_STALL_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_STALL_TIMEOUT_SECONDS", "15"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "0"))
+UPSTREAM_WARMUP_CONNECTIONS = int(os.getenv("UPSTREAM_WARMUP_CONNECTIONS", "2"))
+
+# When a model fails after part of the answer was streamed, the next model
+# either "continue"s it (the partial answer is sent as an assistant prefill)
+# or the client is told to "reset" (an SSE `reset` event clears the partial
+# text) and the next model starts over.
+STREAM_FAILOVER_MODE = os.getenv("STREAM_FAILOVER_MODE", "continue").strip().lower()
+
+# Hedged requests: if the current model has not produced a first token within
+# HEDGE_DELAY_SECONDS, start the next model in CHATBOT_MODELS in parallel and
+# keep whichever streams content first (at most HEDGE_MAX_PARALLEL at once).
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "3.0"))
+HEDGE_MAX_PARALLEL = int(os.getenv("HEDGE_MAX_PARALLEL", "2"))
+
+# Model health tracking: EWMA time-to-first-token and error rate per model,
+# with circuit breakers. A circuit opens after MODEL_CIRCUIT_FAILURE_THRESHOLD
+# consecutive failures (immediately on 404/403/429) and stays open for the
+# provider's Retry-After, or an exponential cooldown starting at
+# MODEL_CIRCUIT_COOLDOWN_SECONDS. Models are tried healthiest first.
+MODEL_HEALTH_ENABLED = os.getenv("MODEL_HEALTH_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+MODEL_HEALTH_EWMA_ALPHA = float(os.getenv("MODEL_HEALTH_EWMA_ALPHA", "0.3"))
+MODEL_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "3"))
+MODEL_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_COOLDOWN_SECONDS", "30"))
+MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS = float(os.getenv("MODEL_CIRCUIT_MAX_COOLDOWN_SECONDS", "600"))
+
+# Opt-in cache for first-turn questions (empty history). Answers are keyed on
+# the normalised question, SYSTEM_PROMPT and model, and replayed to the client
+# in RESPONSE_CACHE_REPLAY_CHUNK_CHARS-sized chunks.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESPONSE_CACHE_REPLAY_CHUNK_CHARS = int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK_CHARS", "64"))
+
+# Single-flight: concurrent identical first-turn questions attach to one
+# upstream generation instead of each opening their own stream.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# Prompt token budgets per model (prompt tokens we are willing to send, not
+# necessarily the model's full context window; smaller prompts stream their
+# first token sooner). Override with a JSON object in MODEL_CONTEXT_BUDGETS.
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("DEFAULT_CONTEXT_BUDGET", "8000"))
+MODEL_CONTEXT_BUDGETS = {
+    "deepseek/deepseek-chat-v3.1:free": 8000,
+    "deepseek/deepseek-chat-v3-0324:free": 8000,
+    "nvidia/llama-3.1-nemotron-ultra-253b-v1:free": 8000,
+}
+MODEL_CONTEXT_BUDGETS.update(json.loads(os.getenv("MODEL_CONTEXT_BUDGETS", "{}")))
+
+# Once prior turns take more than PROMPT_COMPACT_THRESHOLD of the budget left
+# after the system prompt, summary, question and PROMPT_REPLY_RESERVE_TOKENS,
+# the oldest turns are compacted into a rolling summary until history is under
+# PROMPT_COMPACT_TARGET, keeping the PROMPT_KEEP_RECENT_MESSAGES newest verbatim.
+PROMPT_REPLY_RESERVE_TOKENS = int(os.getenv("PROMPT_REPLY_RESERVE_TOKENS", "1024"))
+PROMPT_COMPACT_THRESHOLD = float(os.getenv("PROMPT_COMPACT_THRESHOLD", "0.75"))
+PROMPT_COMPACT_TARGET = float(os.getenv("PROMPT_COMPACT_TARGET", "0.5"))
+PROMPT_KEEP_RECENT_MESSAGES = int(os.getenv("PROMPT_KEEP_RECENT_MESSAGES", "4"))
+PROMPT_SUMMARY_MAX_TOKENS = int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "600"))
+
+# SSE framing for /chat_stream: deltas are coalesced into one frame per
+# SSE_COALESCE_WINDOW_SECONDS (or SSE_COALESCE_MAX_CHARS of text), a comment
+# heartbeat is sent after SSE_HEARTBEAT_SECONDS of silence, and SSE_COMPACT
+# drops optional whitespace and \u escapes from frames.
+SSE_COALESCE_WINDOW_SECONDS = float(os.getenv("SSE_COALESCE_WINDOW_SECONDS", "0.05"))
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "1024"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_COMPACT = os.getenv("SSE_COMPACT", "0").strip().lower() in ("1", "true", "yes", "on")
+
+# Admission control for /chat_stream (limits are per process). Each visitor
+# (cid cookie) and client IP has a token bucket of *_BURST requests refilled
+# at *_RATE_PER_MINUTE; a visitor may hold ADMISSION_MAX_STREAMS_PER_VISITOR
+# streams at once. Beyond ADMISSION_MAX_STREAMS concurrent streams, requests
+# wait in a queue of ADMISSION_MAX_QUEUE for up to
+# ADMISSION_QUEUE_TIMEOUT_SECONDS, and are rejected with an SSE `error` event
+# otherwise. Behind a reverse proxy set TRUSTED_PROXY_HOPS so the client IP is
+# taken from X-Forwarded-For (under uvicorn use --proxy-headers instead).
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+ADMISSION_MAX_STREAMS = int(os.getenv("ADMISSION_MAX_STREAMS", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_MAX_STREAMS_PER_VISITOR = int(os.getenv("ADMISSION_MAX_STREAMS_PER_VISITOR", "2"))
+ADMISSION_VISITOR_RATE_PER_MINUTE = float(os.getenv("ADMISSION_VISITOR_RATE_PER_MINUTE", "12"))
+ADMISSION_VISITOR_BURST = float(os.getenv("ADMISSION_VISITOR_BURST", "5"))
+ADMISSION_IP_RATE_PER_MINUTE = float(os.getenv("ADMISSION_IP_RATE_PER_MINUTE", "60"))
+ADMISSION_IP_BURST = float(os.getenv("ADMISSION_IP_BURST", "20"))
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Resumable /chat_stream: every frame carries an SSE id and the frames of each
+# generation are buffered, so an EventSource that reconnects with
+# Last-Event-ID resumes instead of starting a second completion. A generation
+# with no client attached is abandoned after SSE_REPLAY_GRACE_SECONDS;
+# finished streams stay replayable for SSE_REPLAY_TTL_SECONDS. The buffer is
+# per process: with several workers, resume needs sticky sessions (by the
+# cid cookie or client IP) or a single worker; a reconnect that lands on
+# another worker gets the "Connection Lost" error and the question is asked again.
+SSE_REPLAY_ENABLED = os.getenv("SSE_REPLAY_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+SSE_REPLAY_TTL_SECONDS = float(os.getenv("SSE_REPLAY_TTL_SECONDS", "60"))
+SSE_REPLAY_GRACE_SECONDS = float(os.getenv("SSE_REPLAY_GRACE_SECONDS", "20"))
+SSE_REPLAY_MAX_STREAMS = int(os.getenv("SSE_REPLAY_MAX_STREAMS", "1000"))
+
+# Local prefilter: greetings, thanks and clearly non-astronomy questions are
+# answered with the canned replies in prompts/SystemPrompt.py instead of a
+# model call when the in-process classifier's confidence reaches
+# DOMAIN_FILTER_THRESHOLD (0-1); anything less certain goes upstream. Extra
+# astronomy words (always sent upstream) can be added as a JSON list in
+# DOMAIN_FILTER_ASTRONOMY_TERMS.
+DOMAIN_FILTER_ENABLED = os.getenv("DOMAIN_FILTER_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+DOMAIN_FILTER_THRESHOLD = float(os.getenv("DOMAIN_FILTER_THRESHOLD", "0.75"))
+DOMAIN_FILTER_MAX_WORDS = int(os.getenv("DOMAIN_FILTER_MAX_WORDS", "40"))
+DOMAIN_FILTER_ASTRONOMY_TERMS = json.loads(os.getenv("DOMAIN_FILTER_ASTRONOMY_TERMS", "[]"))
+
+# Upstream pacing: requests per minute we allow ourselves per model (free
+# OpenRouter models allow ~20), so calls are spread out instead of running
+# into 429s. An attempt waits up to MODEL_PACING_MAX_WAIT_SECONDS for its
+# model's budget, otherwise that model is skipped for this request. Override
+# per model with a JSON object in MODEL_RATE_LIMITS.
+MODEL_PACING_ENABLED = os.getenv("MODEL_PACING_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+DEFAULT_MODEL_RATE_PER_MINUTE = float(os.getenv("DEFAULT_MODEL_RATE_PER_MINUTE", "20"))
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+MODEL_PACING_BURST = float(os.getenv("MODEL_PACING_BURST", "5"))
+MODEL_PACING_MAX_WAIT_SECONDS = float(os.getenv("MODEL_PACING_MAX_WAIT_SECONDS", "2"))
+
 if not API_KEY:
     # Fail fast with a clear error message so it's obvious in logs.
     raise RuntimeError(
@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class _Conversation:
+    """A single conversation bucket: its messages plus bookkeeping for eviction."""
+
+    __slots__ = ("messages", "summary", "nbytes", "last_access")
+
+    def __init__(self, now: float):
+        self.messages: List[dict] = []
+        self.summary: Optional[str] = None  # Rolling summary of compacted turns
+        self.nbytes = 0
+        self.last_access = now
+
+
+def _message_size(message: dict) -> int:
+    """Approximate memory cost of a stored message (UTF-8 payload bytes)."""
+    return len(message.get("role", "")) + len(message.get("content", "").encode("utf-8"))
+
+
+class ConversationStore:
+    """Bounded in-memory conversation history with LRU + idle-TTL eviction.
+
+    Conversations are kept in an OrderedDict ordered by last access, so the
+    least recently used conversation is always at the front. The store is
+    bounded by number of conversations, total bytes across all messages and
+    messages per conversation (oldest turns are trimmed first). With a
+    ``summarize(summary, messages) -> summary`` callback, trimmed turns are
+    folded into the conversation's rolling summary instead of being lost.
+
+    Structural changes (insert, evict, move-to-end) are guarded by a single
+    short-lived index lock. Callers that need a read-modify-write sequence on
+    one conversation (e.g. append a user turn, stream, then append or roll
+    back) can hold ``lock(conversation_id)``, a striped lock shared by all
+    conversations hashing to the same stripe.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 10000,
+        idle_ttl: float = 3600.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_turns: int = 40,
+        lock_stripes: int = 64,
+        summarize: Optional[Callable[[Optional[str], List[dict]], str]] = None,
+    ):
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.summarize = summarize
+
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._index_lock = threading.Lock()
+        self._stripes = [threading.RLock() for _ in range(max(1, lock_stripes))]
+        self._total_bytes = 0
+
+        # Counters exposed through stats()
+        self._evicted_lru = 0
+        self._evicted_ttl = 0
+        self._evicted_bytes = 0
+        self._trimmed_messages = 0
+
+    # --- Locking ---
+    @contextmanager
+    def lock(self, conversation_id: str):
+        """Hold the stripe lock for a conversation across several operations."""
+        stripe = self._stripes[hash(conversation_id) % len(self._stripes)]
+        with stripe:
+            yield
+
+    # --- Internal helpers (index lock must be held) ---
+    def _touch(self, conversation_id: str, now: float, create: bool) -> Optional[_Conversation]:
+        conv = self._conversations.get(conversation_id)
+        if conv is not None and self.idle_ttl and now - conv.last_access > self.idle_ttl:
+            self._drop(conversation_id)
+            self._evicted_ttl += 1
+            conv = None
+        if conv is None:
+            if not create:
+                return None
+            conv = _Conversation(now)
+            self._conversations[conversation_id] = conv
+        else:
+            self._conversations.move_to_end(conversation_id)
+        conv.last_access = now
+        return conv
+
+    def _drop(self, conversation_id: str) -> None:
+        conv = self._conversations.pop(conversation_id, None)
+        if conv is not None:
+            self._total_bytes -= conv.nbytes
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        # Idle conversations sit at the front, so the TTL sweep stops at the
+        # first conversation that is still fresh.
+        if self.idle_ttl:
+            while self._conversations:
+                cid, conv = next(iter(self._conversations.items()))
+                if cid == keep or now - conv.last_access <= self.idle_ttl:
+                    break
+                self._drop(cid)
+                self._evicted_ttl += 1
+
+        while len(self._conversations) > self.max_conversations:
+            cid = next(iter(self._conversations))
+            if cid == keep:
+                break
+            self._drop(cid)
+            self._evicted_lru += 1
+
+        while self._total_bytes > self.max_bytes and len(self._conversations) > 1:
+            cid = next(iter(self._conversations))
+            if cid == keep:
+                break
+            self._drop(cid)
+            self._evicted_bytes += 1
+
+    # --- Public API ---
+    def start(self, conversation_id: str) -> None:
+        now = time.monotonic()
+        with self._index_lock:
+            self._touch(conversation_id, now, create=True)
+            self._evict(now, keep=conversation_id)
+
+    def get(self, conversation_id: str) -> List[dict]:
+        now = time.monotonic()
+        with self._index_lock:
+            conv = self._touch(conversation_id, now, create=False)
+            return list(conv.messages) if conv is not None else []
+
+    def append(self, conversation_id: str, *messages: dict) -> None:
+        """Append messages to a conversation, trimming and evicting as needed."""
+        now = time.monotonic()
+        with self._index_lock:
+            conv = self._touch(conversation_id, now, create=True)
+            for message in messages:
+                size = _message_size(message)
+                conv.messages.append(message)
+                conv.nbytes += size
+                self._total_bytes += size
+            # Trim oldest messages beyond the per-conversation cap
+            overflow = len(conv.messages) - self.max_turns
+            if overflow > 0:
+                removed = conv.messages[:overflow]
+                del conv.messages[:overflow]
+                freed = sum(_message_size(m) for m in removed)
+                if self.summarize is not None:
+                    old_summary = conv.summary
+                    conv.summary = self.summarize(old_summary, removed)
+                    freed += len((old_summary or "").encode("utf-8")) - len(conv.summary.encode("utf-8"))
+                conv.nbytes -= freed
+                self._total_bytes -= freed
+                self._trimmed_messages += overflow
+            self._evict(now, keep=conversation_id)
+
+    def pop_last(self, conversation_id: str, message: dict) -> bool:
+        """Remove the last message if it equals ``message``. Returns True if removed."""
+        with self._index_lock:
+            conv = self._conversations.get(conversation_id)
+            if conv is None or not conv.messages or conv.messages[-1] != message:
+                return False
+            conv.messages.pop()
+            size = _message_size(message)
+            conv.nbytes -= size
+            self._total_bytes -= size
+            return True
+
+    def get_summary(self, conversation_id: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._index_lock:
+            conv = self._conversations.get(conversation_id)
+            if conv is None or (self.idle_ttl and now - conv.last_access > self.idle_ttl):
+                return None  # Idle past the TTL: gone even if not evicted yet
+            return conv.summary
+
+    def compact(self, conversation_id: str, count: int, summary: str) -> None:
+        """Replace the oldest ``count`` messages with an updated rolling summary."""
+        with self._index_lock:
+            conv = self._conversations.get(conversation_id)
+            if conv is None:
+                return
+            removed = conv.messages[:count]
+            del conv.messages[:count]
+            freed = sum(_message_size(m) for m in removed) + len((conv.summary or "").encode("utf-8"))
+            added = len(summary.encode("utf-8"))
+            conv.summary = summary
+            conv.nbytes += added - freed
+            self._total_bytes += added - freed
+
+    def clear(self, conversation_id: str) -> None:
+        with self._index_lock:
+            self._drop(conversation_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._index_lock:
+            return {
+                "conversations": len(self._conversations),
+                "messages": sum(len(c.messages) for c in self._conversations.values()),
+                "bytes": self._total_bytes,
+                "max_conversations": self.max_conversations,
+                "max_bytes": self.max_bytes,
+                "evicted_lru": self._evicted_lru,
+                "evicted_ttl": self._evicted_ttl,
+                "evicted_bytes": self._evicted_bytes,
+                "trimmed_messages": self._trimmed_messages,
+            }
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._index_lock:
+            return conversation_id in self._conversations
+
+    def __len__(self) -> int:
+        with self._index_lock:
+            return len(self._conversations)
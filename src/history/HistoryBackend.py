@@ -0,0 +1,38 @@
+from config.config import *
+from history.ConversationStore import ConversationStore
+from history.SQLiteStore import SQLiteStore
+from prompts.PromptBudget import summarize_turns
+
+
+def _summarize(summary, messages):
+    # Turns beyond HISTORY_MAX_TURNS join the rolling summary that prompt
+    # compaction maintains, rather than being dropped silently
+    return summarize_turns(summary, messages, PROMPT_SUMMARY_MAX_TOKENS)
+
+
+def create_history_store():
+    """Build the conversation history backend selected by HISTORY_BACKEND.
+
+    "memory" (default) keeps history in this process only; "sqlite" shares it
+    between worker processes and across restarts via HISTORY_DB_PATH.
+    """
+    if HISTORY_BACKEND == "memory":
+        return ConversationStore(
+            max_conversations=HISTORY_MAX_CONVERSATIONS,
+            idle_ttl=HISTORY_IDLE_TTL_SECONDS,
+            max_bytes=HISTORY_MAX_BYTES,
+            max_turns=HISTORY_MAX_TURNS,
+            lock_stripes=HISTORY_LOCK_STRIPES,
+            summarize=_summarize,
+        )
+    if HISTORY_BACKEND == "sqlite":
+        return SQLiteStore(
+            HISTORY_DB_PATH,
+            idle_ttl=HISTORY_IDLE_TTL_SECONDS,
+            max_turns=HISTORY_MAX_TURNS,
+            flush_interval=HISTORY_FLUSH_INTERVAL_SECONDS,
+            batch_size=HISTORY_BATCH_SIZE,
+            lock_stripes=HISTORY_LOCK_STRIPES,
+            summarize=_summarize,
+        )
+    raise ValueError(f"Unknown HISTORY_BACKEND: {HISTORY_BACKEND!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,383 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at);
+CREATE TABLE IF NOT EXISTS summaries (
+    conversation_id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteStore:
+    """Conversation history shared between processes through an SQLite file.
+
+    The database runs in WAL mode so several gunicorn workers can read while
+    one of them writes. Appends are queued in memory and committed by a
+    background writer thread in one transaction per batch (every
+    ``flush_interval`` seconds or ``batch_size`` messages, whichever comes
+    first). Reads merge the committed rows with this process's pending rows,
+    so a worker always sees its own writes immediately; other workers see
+    them after the next flush.
+
+    Exposes the same interface as ConversationStore so ChatClient does not
+    care which backend it is talking to, including the ``summarize``
+    callback that folds turns beyond ``max_turns`` into the summary.
+
+    A conversation idle for longer than ``idle_ttl`` is gone, as in
+    ConversationStore, even before the periodic sweep deletes its rows: its
+    summary is no longer returned, and if it is used again the turns from
+    before the idle gap are dropped rather than coming back.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        idle_ttl: float = 3600.0,
+        max_turns: int = 40,
+        flush_interval: float = 0.05,
+        batch_size: int = 64,
+        lock_stripes: int = 64,
+        summarize: Optional[Callable[[Optional[str], List[dict]], str]] = None,
+    ):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._stripes = [threading.RLock() for _ in range(max(1, lock_stripes))]
+        self._local = threading.local()
+        self._pending: List[Tuple[str, str, str, float]] = []
+        self._pending_lock = threading.Lock()
+        # Held while a batch moves from _pending into the database, so readers
+        # never observe a batch that is in neither place.
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+
+        # Counters exposed through stats()
+        self._flushes = 0
+        self._flushed_messages = 0
+        self._expired_messages = 0
+        self._folded_messages = 0
+
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+        atexit.register(self.flush)
+
+    # --- Connections and writer thread ---
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread (and per process: connections must not
+        # cross a gunicorn fork).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_writer(self) -> None:
+        # Threads do not survive fork, so (re)start the writer per process.
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._pending_lock:
+            if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self) -> None:
+        last_expiry = time.time()
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                # Expire idle conversations now and then rather than on every flush
+                if self.idle_ttl and time.time() - last_expiry > min(self.idle_ttl, 60.0):
+                    self._expire()
+                    last_expiry = time.time()
+            except sqlite3.Error as e:
+                print(f"⚠️ History writer error: {e}", flush=True)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.idle_ttl
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM messages WHERE conversation_id IN ("
+                " SELECT conversation_id FROM messages GROUP BY conversation_id"
+                " HAVING MAX(created_at) < ?)",
+                (cutoff,),
+            )
+            conn.execute(
+                "DELETE FROM summaries WHERE updated_at < ? AND conversation_id NOT IN"
+                " (SELECT DISTINCT conversation_id FROM messages)",
+                (cutoff,),
+            )
+        self._expired_messages += cur.rowcount
+
+    def flush(self) -> None:
+        """Commit all pending appends in a single transaction."""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+        self._flushes += 1
+        self._flushed_messages += len(batch)
+
+    # --- Locking ---
+    @contextmanager
+    def lock(self, conversation_id: str):
+        """Hold the stripe lock for a conversation (process-local)."""
+        stripe = self._stripes[hash(conversation_id) % len(self._stripes)]
+        with stripe:
+            yield
+
+    # --- Public API ---
+    def start(self, conversation_id: str) -> None:
+        # Conversations exist implicitly once they have a message.
+        return None
+
+    def _live_start(self, rows: List[tuple], now: float) -> int:
+        """Index in ``rows`` (oldest first, timestamp last) of the first turn
+        after the latest idle gap longer than ``idle_ttl``; ``len(rows)`` if
+        the conversation has been idle that long since its last turn."""
+        if not self.idle_ttl or not rows:
+            return 0
+        if now - rows[-1][-1] > self.idle_ttl:
+            return len(rows)
+        for i in range(len(rows) - 1, 0, -1):
+            if rows[i][-1] - rows[i - 1][-1] > self.idle_ttl:
+                return i
+        return 0
+
+    def _drop_expired(self, conversation_id: str, before: Optional[float]) -> None:
+        """Delete the turns (and summary) of an expired session that the
+        periodic sweep has not removed yet. ``before`` is the first live
+        turn's timestamp, or None if the whole conversation expired."""
+        conn = self._conn()
+        with conn:
+            if before is None:
+                cur = conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+            else:
+                cur = conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ? AND created_at < ?", (conversation_id, before)
+                )
+                conn.execute(
+                    "DELETE FROM summaries WHERE conversation_id = ? AND updated_at < ?", (conversation_id, before)
+                )
+        self._expired_messages += cur.rowcount
+
+    def get(self, conversation_id: str) -> List[dict]:
+        with self._flush_lock:
+            # One row more than the cap tells us whether older turns must be folded
+            rows = self._conn().execute(
+                "SELECT role, content, created_at FROM messages WHERE conversation_id = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (conversation_id, self.max_turns + 1),
+            ).fetchall()
+            rows.reverse()
+            with self._pending_lock:
+                rows.extend((role, content, ts) for cid, role, content, ts in self._pending if cid == conversation_id)
+            start = self._live_start(rows, time.time())
+            if start:
+                # Idle past the TTL (and not swept yet): the earlier turns are gone
+                self._drop_expired(conversation_id, rows[start][2] if start < len(rows) else None)
+                rows = rows[start:]
+        if not rows:
+            return []
+        if len(rows) > self.max_turns and self.summarize is not None:
+            self._fold(conversation_id)
+        return [{"role": role, "content": content} for role, content, _ in rows[-self.max_turns:]]
+
+    def _fold(self, conversation_id: str) -> None:
+        """Move the messages beyond the newest ``max_turns`` into the summary."""
+        self.flush()
+        with self._flush_lock:
+            conn = self._conn()
+            rows = conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,),
+            ).fetchall()
+            start = self._live_start(rows, time.time())
+            if start:
+                # Turns from before an idle gap older than get() looked at: never summarize them
+                self._drop_expired(conversation_id, rows[start][3] if start < len(rows) else None)
+                rows = rows[start:]
+            overflow = rows[:-self.max_turns]
+            if not overflow:
+                return
+            with conn:
+                row = conn.execute(
+                    "SELECT content FROM summaries WHERE conversation_id = ?", (conversation_id,)
+                ).fetchone()
+                summary = self.summarize(
+                    row[0] if row is not None else None,
+                    [{"role": role, "content": content} for _, role, content, _ in overflow],
+                )
+                conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ? AND id <= ?",
+                    (conversation_id, overflow[-1][0]),
+                )
+                conn.execute(
+                    "INSERT INTO summaries (conversation_id, content, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(conversation_id) DO UPDATE SET content = excluded.content,"
+                    " updated_at = excluded.updated_at",
+                    (conversation_id, summary, time.time()),
+                )
+        self._folded_messages += len(overflow)
+
+    def append(self, conversation_id: str, *messages: dict) -> None:
+        now = time.time()
+        with self._pending_lock:
+            for message in messages:
+                self._pending.append((conversation_id, message["role"], message["content"], now))
+            full = len(self._pending) >= self.batch_size
+        self._ensure_writer()
+        if full:
+            self._wakeup.set()
+
+    def pop_last(self, conversation_id: str, message: dict) -> bool:
+        """Remove the last message if it equals ``message``. Returns True if removed."""
+        with self._flush_lock:
+            with self._pending_lock:
+                for i in range(len(self._pending) - 1, -1, -1):
+                    cid, role, content, _ = self._pending[i]
+                    if cid != conversation_id:
+                        continue
+                    if role == message["role"] and content == message["content"]:
+                        del self._pending[i]
+                        return True
+                    return False
+            conn = self._conn()
+            with conn:
+                row = conn.execute(
+                    "SELECT id, role, content FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 1",
+                    (conversation_id,),
+                ).fetchone()
+                if row is None or row[1] != message["role"] or row[2] != message["content"]:
+                    return False
+                conn.execute("DELETE FROM messages WHERE id = ?", (row[0],))
+            return True
+
+    def get_summary(self, conversation_id: str) -> Optional[str]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT content, updated_at FROM summaries WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        content, updated_at = row
+        if self.idle_ttl:
+            # The summary expired with its session if the conversation has
+            # been idle longer than the TTL at any point since it was written
+            times = [(updated_at,)] + conn.execute(
+                "SELECT created_at FROM messages WHERE conversation_id = ? AND created_at >= ? ORDER BY id",
+                (conversation_id, updated_at),
+            ).fetchall()
+            with self._pending_lock:
+                times.extend((p[3],) for p in self._pending if p[0] == conversation_id)
+            if self._live_start(times, time.time()):
+                return None
+        return content
+
+    def compact(self, conversation_id: str, count: int, summary: str) -> None:
+        """Replace the oldest ``count`` messages with an updated rolling summary."""
+        self.flush()
+        with self._flush_lock:
+            conn = self._conn()
+            with conn:
+                # ``count`` is relative to what get() returns (the newest
+                # max_turns rows); anything older goes as well.
+                ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+                    (conversation_id, self.max_turns),
+                )]
+                ids.reverse()
+                if count > 0 and ids:
+                    conn.execute(
+                        "DELETE FROM messages WHERE conversation_id = ? AND id <= ?",
+                        (conversation_id, ids[min(count, len(ids)) - 1]),
+                    )
+                conn.execute(
+                    "INSERT INTO summaries (conversation_id, content, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT(conversation_id) DO UPDATE SET content = excluded.content,"
+                    " updated_at = excluded.updated_at",
+                    (conversation_id, summary, time.time()),
+                )
+
+    def clear(self, conversation_id: str) -> None:
+        with self._flush_lock:
+            with self._pending_lock:
+                self._pending = [p for p in self._pending if p[0] != conversation_id]
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+
+    def stats(self) -> Dict[str, int]:
+        conversations, messages = self._conn().execute(
+            "SELECT COUNT(DISTINCT conversation_id), COUNT(*) FROM messages"
+        ).fetchone()
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "conversations": conversations,
+            "messages": messages,
+            "pending_messages": pending,
+            "flushes": self._flushes,
+            "flushed_messages": self._flushed_messages,
+            "expired_messages": self._expired_messages,
+            "folded_messages": self._folded_messages,
+        }
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._pending_lock:
+            if any(p[0] == conversation_id for p in self._pending):
+                return True
+        row = self._conn().execute(
+            "SELECT 1 FROM messages WHERE conversation_id = ? LIMIT 1", (conversation_id,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(DISTINCT conversation_id) FROM messages").fetchone()[0]
@@ -0,0 +1,272 @@
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from prompts.PromptBudget import CHARS_PER_TOKEN
+
+
+# Lightweight, dependency-free Prometheus text-format metrics. Each metric
+# holds its own lock; observations are a dict lookup plus a bisect, cheap
+# enough to leave on in production.
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Sampled(_Metric):
+    """A metric holding one value per label set, either updated in place or
+    computed at scrape time by ``set_function``."""
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """Compute the values at scrape time: ``function()`` returns
+        ``{label_values_tuple: value}``."""
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            try:
+                items = list(self._function().items())
+            except Exception as e:
+                print(f"⚠️ Metrics collection failed for {self.name}: {e}", flush=True)
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Counter(_Sampled):
+    """Monotonic count. With ``set_function``, it must read a counter that
+    only ever grows (e.g. a store's hit count), never a current level."""
+
+    kind = "counter"
+
+
+class Gauge(_Sampled):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Sequence[float] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = self._header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Upstream model streams ---
+TTFT_SECONDS = REGISTRY.register(Histogram(
+    "astro_ttft_seconds", "Time from opening a model stream to its first content chunk.",
+    ["model"], buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)))
+STREAM_DURATION_SECONDS = REGISTRY.register(Histogram(
+    "astro_stream_duration_seconds", "Time from opening a model stream to its last content chunk.",
+    ["model"], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)))
+INTER_CHUNK_SECONDS = REGISTRY.register(Histogram(
+    "astro_inter_chunk_seconds", "Gap between consecutive content chunks of a model stream.",
+    ["model"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "astro_stream_tokens_per_second", "Estimated output tokens per second after the first chunk.",
+    ["model"], buckets=(1, 5, 10, 20, 40, 80, 160, 320)))
+MODEL_ATTEMPTS = REGISTRY.register(Counter(
+    "astro_model_attempts_total", "Model attempts by outcome (success, empty, error, cancelled).",
+    ["model", "outcome"]))
+MODEL_ERRORS = REGISTRY.register(Counter(
+    "astro_model_errors_total", "Failed model attempts by exception class.", ["model", "error"]))
+FALLBACKS = REGISTRY.register(Counter(
+    "astro_fallbacks_total", "Requests answered by a model other than the first one tried.", ["model"]))
+STREAM_FAILOVERS = REGISTRY.register(Counter(
+    "astro_stream_failovers_total", "Models that failed after partial output, by recovery (continue, reset).",
+    ["mode"]))
+MODEL_PACING = REGISTRY.register(Counter(
+    "astro_model_pacing_total", "Model attempts held back by upstream pacing (delayed, skipped).",
+    ["model", "result"]))
+PREFILTER_DECISIONS = REGISTRY.register(Counter(
+    "astro_prefilter_decisions_total", "Local prefilter decisions by label and route (local, upstream).",
+    ["label", "route"]))
+MODEL_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "astro_model_circuit_open", "1 while a model's circuit breaker is open.", ["model"]))
+
+# --- SSE / conversations ---
+SSE_ACTIVE_STREAMS = REGISTRY.register(Gauge(
+    "astro_sse_active_streams", "Currently open /chat_stream responses."))
+SSE_STREAMS = REGISTRY.register(Counter(
+    "astro_sse_streams_total", "Finished /chat_stream responses by result (end, error, disconnect).",
+    ["result"]))
+SSE_RESUMES = REGISTRY.register(Counter(
+    "astro_sse_resumes_total", "/chat_stream reconnects with Last-Event-ID by result (resumed, expired).",
+    ["result"]))
+SSE_REPLAY_STREAMS = REGISTRY.register(Gauge(
+    "astro_sse_replay_streams", "Streams held by the replay buffer (streams, in_flight).", ["state"]))
+CONVERSATIONS = REGISTRY.register(Gauge(
+    "astro_conversations", "Conversations held by the history store."))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    "astro_response_cache_events_total", "Response cache events (hits, misses, stores, evictions).", ["event"]))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "astro_response_cache_entries", "Answers held by the response cache."))
+CACHE_BYTES = REGISTRY.register(Gauge(
+    "astro_response_cache_bytes", "Size of the answers held by the response cache."))
+SINGLE_FLIGHT_EVENTS = REGISTRY.register(Counter(
+    "astro_single_flight_events_total", "Single-flight generations started and requests joined to one.",
+    ["event"]))
+SINGLE_FLIGHT_IN_FLIGHT = REGISTRY.register(Gauge(
+    "astro_single_flight_in_flight", "Shared generations currently running."))
+
+_CACHE_LEVELS = ("entries", "bytes")
+
+# --- Admission control ---
+ADMISSIONS = REGISTRY.register(Counter(
+    "astro_admissions_total", "/chat_stream admission decisions (admitted, queued, rejected_<reason>).",
+    ["result"]))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "astro_admission_wait_seconds", "Time queued requests waited for a stream slot.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)))
+ADMISSION_STREAMS = REGISTRY.register(Gauge(
+    "astro_admission_streams", "Admitted (active) and queued /chat_stream requests.", ["state"]))
+
+
+def bind_client(client) -> None:
+    """Point the scrape-time gauges at a ChatClient's stores."""
+    CONVERSATIONS.set_function(lambda: {(): len(client.histories)})
+    if client.cache is not None:
+        CACHE_EVENTS.set_function(
+            lambda: {(k,): v for k, v in client.cache.stats().items() if k not in _CACHE_LEVELS})
+        CACHE_ENTRIES.set_function(lambda: {(): client.cache.stats()["entries"]})
+        CACHE_BYTES.set_function(lambda: {(): client.cache.stats()["bytes"]})
+    if client.flights is not None:
+        SINGLE_FLIGHT_EVENTS.set_function(
+            lambda: {(k,): v for k, v in client.flights.stats().items() if k != "in_flight"})
+        SINGLE_FLIGHT_IN_FLIGHT.set_function(lambda: {(): client.flights.stats()["in_flight"]})
+    if client.health is not None:
+        MODEL_CIRCUIT_OPEN.set_function(
+            lambda: {(m,): float(s["state"] == "open") for m, s in client.health.stats().items()})
+
+
+def bind_admission(controller) -> None:
+    """Point the admission gauge at an AdmissionController."""
+    ADMISSION_STREAMS.set_function(lambda: {(k,): v for k, v in controller.stats().items() if k != "visitors"})
+
+
+def bind_replay(replays) -> None:
+    """Point the replay gauge at a ReplayBuffer."""
+    SSE_REPLAY_STREAMS.set_function(lambda: {(k,): v for k, v in replays.stats().items()})
+
+
+class StreamTimer:
+    """Record TTFT, inter-chunk gaps, duration and throughput of one model stream."""
+
+    __slots__ = ("model", "started", "first", "last", "chars")
+
+    def __init__(self, model: str, started: Optional[float] = None):
+        self.model = model
+        self.started = time.monotonic() if started is None else started
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.chars = 0
+
+    def chunk(self, text: str) -> None:
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+            TTFT_SECONDS.observe(now - self.started, self.model)
+        else:
+            INTER_CHUNK_SECONDS.observe(now - self.last, self.model)
+        self.last = now
+        self.chars += len(text)
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first is None else self.first - self.started
+
+    def finish(self) -> None:
+        if self.first is None:
+            return
+        STREAM_DURATION_SECONDS.observe(self.last - self.started, self.model)
+        if self.last > self.first:
+            tokens = self.chars / CHARS_PER_TOKEN
+            TOKENS_PER_SECOND.observe(tokens / (self.last - self.first), self.model)
@@ -0,0 +1,95 @@
+import re
+from typing import List, Optional, Tuple
+
+
+# Rough token estimate without a tokenizer dependency: ~4 characters per
+# token for English text, plus a few tokens of per-message framing.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _first_sentence(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[: limit - 1].rstrip() + "…"
+
+
+def summarize_turns(previous: Optional[str], messages: List[dict], max_tokens: int) -> str:
+    """Fold ``messages`` into the rolling summary ``previous``.
+
+    Extractive and local (no upstream call): each compacted message becomes
+    one line holding the first sentence of what was said. When the summary
+    outgrows ``max_tokens`` the oldest lines are dropped first.
+    """
+    lines = previous.splitlines() if previous else []
+    for message in messages:
+        who = "User" if message.get("role") == "user" else "Assistant"
+        lines.append(f"- {who}: {_first_sentence(message.get('content', ''), 200)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class PromptBudget:
+    """Decide how much conversation history fits a model's prompt budget.
+
+    ``budget`` is the number of prompt tokens we are willing to send (the
+    model's context budget minus ``reply_reserve`` for the answer). Once the
+    prior turns exceed ``compact_threshold`` of what is left after the system
+    prompt, summary and question, the oldest turns are compacted (in whole
+    user/assistant pairs) until history is back under ``compact_target``,
+    always keeping the ``keep_recent`` newest messages verbatim if they fit.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        reply_reserve: int = 1024,
+        compact_threshold: float = 0.75,
+        compact_target: float = 0.5,
+        keep_recent: int = 4,
+    ):
+        self.budget = budget
+        self.reply_reserve = reply_reserve
+        self.compact_threshold = compact_threshold
+        self.compact_target = compact_target
+        self.keep_recent = keep_recent
+
+    def plan(self, fixed_tokens: int, prior: List[dict]) -> int:
+        """Return how many of the oldest ``prior`` messages to compact.
+
+        ``fixed_tokens`` covers everything that is always sent: system
+        prompt, current summary and the new question.
+        """
+        available = max(0, self.budget - self.reply_reserve - fixed_tokens)
+        sizes = [message_tokens(m) for m in prior]
+        total = sum(sizes)
+        if total <= available * self.compact_threshold:
+            return 0
+
+        target = available * self.compact_target
+        count = 0
+        # Compact whole pairs, oldest first, but leave the recent turns alone
+        while total > target and len(prior) - count > self.keep_recent:
+            step = min(2, len(prior) - count)
+            total -= sum(sizes[count:count + step])
+            count += step
+        # Still over the hard budget: give up on keeping recent turns verbatim
+        while total > available and count < len(prior):
+            total -= sizes[count]
+            count += 1
+        return count
+
+    def split(self, fixed_tokens: int, prior: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Return ``(to_compact, to_keep)``."""
+        count = self.plan(fixed_tokens, prior)
+        return prior[:count], prior[count:]
@@ -37,4 +37,13 @@ _Example_: "It does not appear your question is related to astronomy. Please rep
 _Example_: "Is there anything else I can help you with today?"
 
 - **Exception** If user asks who Wilson is, anwser he is 0.001 years old and has a strawberry as a nose
-"""
\ No newline at end of file
+"""
+
+# Replies the local prefilter (routing.DomainFilter) sends without calling a
+# model; they follow the examples in SYSTEM_PROMPT above.
+CANNED_REPLIES = {
+    "greeting": "Hi, welcome to Red Nebula! I am Astro Intelligence. What would you like to know about astronomy?",
+    "thanks": "You're welcome! Is there anything else I can help you with today?",
+    "out_of_domain": "It does not appear your question is related to astronomy. Please rephrase your question. "
+                     "I am happy to help.",
+}
@@ -0,0 +1,174 @@
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+
+# In-process vocabularies for the prefilter. Astronomy terms only ever send
+# a question upstream, so this list is meant to be generous; the other lists
+# should stay short and unambiguous.
+ASTRONOMY_TERMS = frozenset("""
+    astronomy astronomer astronomers astronomical astrophysics astrophysicist cosmology cosmic cosmos
+    universe universes space spacecraft spaceship astronaut astronauts cosmonaut nasa esa jaxa isro spacex
+    star stars stellar starlight sun suns solar sunspot sunspots sunlight sunset sunrise corona
+    planet planets planetary exoplanet exoplanets dwarf moon moons lunar satellite satellites orbit orbits
+    orbital orbiting mercury venus earth mars martian jupiter saturn uranus neptune pluto ceres eris
+    titan europa io ganymede callisto enceladus triton phobos deimos charon
+    galaxy galaxies galactic milky andromeda nebula nebulae cluster clusters constellation constellations
+    comet comets asteroid asteroids meteor meteors meteorite meteorites meteoroid kuiper oort
+    eclipse eclipses equinox solstice tide tides aurora auroras zodiac
+    telescope telescopes observatory hubble webb jwst kepler spitzer chandra gaia voyager apollo artemis
+    rover rovers probe probes launch rocket rockets iss
+    gravity gravitational graviton spacetime relativity redshift blueshift parallax light-year lightyear
+    lightyears parsec parsecs magnitude luminosity spectrum spectra wavelength radiation
+    supernova supernovae nova pulsar pulsars quasar quasars magnetar neutron blackhole hole holes
+    wormhole wormholes singularity horizon accretion dark matter energy bang inflation
+    photon photons plasma fusion hydrogen helium
+    celestial heavens sky skies night stargazing zenith
+""".split())
+
+# Words that are a greeting on their own; multi-word greetings ("good
+# morning", "nice to meet you") are matched by _GREETING_PHRASES
+GREETING_TERMS = frozenset("""
+    hi hello hey heya hiya howdy greetings yo sup morning bonjour hola ciao
+""".split())
+
+# Thanks, acknowledgements and goodbyes
+THANKS_TERMS = frozenset("""
+    thanks thank thx ty cheers appreciate appreciated great awesome perfect cool ok okay bye goodbye
+    good nice fine excellent wonderful
+""".split())
+
+OUT_OF_DOMAIN_TERMS = frozenset("""
+    recipe recipes cook cooking bake baking pizza pasta pancakes cake dinner lunch breakfast restaurant
+    football soccer basketball baseball tennis golf nba nfl fifa match score scored team league
+    stock stocks shares crypto bitcoin ethereum invest investing investment mortgage loan loans tax taxes
+    salary bank banking insurance
+    python javascript java sql html css programming code coding compile debug excel
+    movie movies film films song songs lyrics album singer actor actress netflix tv series anime
+    election president politics political government senator vote
+    doctor medicine symptoms disease diet weight workout headache pregnant
+    boyfriend girlfriend dating relationship wedding
+    car cars engine flight flights hotel hotels visa passport
+    homework essay poem joke jokes translate translation
+""".split())
+
+# Carry no domain signal either way
+FILLER_TERMS = frozenset("""
+    a an the and or but if so of to in on at by for with from into as is are was were be been being am
+    do does did have has had i me my mine you your yours he she it its we us our they them their this that
+    these those there here very really much just also all too yes no not lot lots it's there's i'm you're
+""".split())
+
+# Question words and requests: the message asks for something, so it is not
+# a bare greeting or thanks (evidence against a local answer, like unknown words)
+REQUEST_TERMS = frozenset("""
+    what which who whom whose when where why how what's how's who's can could would should will shall may
+    might must please tell know explain describe elaborate give show let help want need like mean more most
+    some any many else again continue then next example examples detail details about over under can't
+    don't
+""".split())
+
+# Greeting idioms, some made of request words ("how are you?") or of words
+# that alone are only an acknowledgement ("good", "nice")
+_GREETING_PHRASES = re.compile(
+    r"\b(how are you|how are u|how's it going|how is it going|what's up|whats up"
+    r"|good (?:morning|afternoon|evening|day)|(?:nice|pleased|glad) to meet you)\b\s*\??"
+)
+_WORD = re.compile(r"[a-z][a-z'\-]*")
+
+
+def _words(text: str) -> Tuple[list, bool]:
+    """The message's words, and whether it asks a question (a "?" outside
+    greeting idioms)."""
+    text = _GREETING_PHRASES.sub(" hello ", unicodedata.normalize("NFKC", text).casefold())
+    return _WORD.findall(text), "?" in text
+
+
+class Decision:
+    """What the prefilter made of one question: ``label`` is one of
+    "greeting", "thanks", "out_of_domain" or "astronomy"/"unknown" (both
+    sent upstream), with a ``confidence`` in [0, 1] and the words that
+    counted for each vocabulary in ``hits``."""
+
+    __slots__ = ("label", "confidence", "hits", "answered")
+
+    def __init__(self, label: str, confidence: float, hits: Dict[str, int], answered: bool):
+        self.label = label
+        self.confidence = confidence
+        self.hits = hits
+        self.answered = answered  # True when the canned reply should be used
+
+
+class DomainFilter:
+    """Cheap local stage in front of model dispatch.
+
+    A question is split into words and matched against small in-process
+    vocabularies. Any astronomy term sends it upstream. Otherwise the share
+    of meaningful (non-filler) words that are greetings, thanks or clearly
+    off-topic terms is its confidence; unknown words and question words or
+    requests ("why", "explain", "more"..., or a question mark) count as
+    evidence against (``unknown_weight`` each). Greetings and thanks are
+    only answered locally when the whole message is greeting/thanks
+    vocabulary, so "ok, tell me more" reaches the model. Off-topic
+    questions are only answered locally when they open a conversation
+    (``follow_up=False``): "and for cars?" may continue an astronomy thread.
+    Only a decision at or above ``threshold`` is answered locally,
+    everything ambiguous goes to the model, which still applies the system
+    prompt's own scope rules. Questions longer than ``max_words`` always go
+    upstream.
+    """
+
+    def __init__(self, threshold: float = 0.75, max_words: int = 40, unknown_weight: float = 0.5,
+                 extra_astronomy_terms: Iterable[str] = ()):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.unknown_weight = unknown_weight
+        self.astronomy: FrozenSet[str] = ASTRONOMY_TERMS | {t.casefold() for t in extra_astronomy_terms}
+
+    def classify(self, question: str, follow_up: bool = False) -> Decision:
+        """Classify ``question``; ``follow_up`` is True when the conversation
+        already has earlier turns."""
+        words, asks = _words(question)
+        hits = {"astronomy": 0, "greeting": 0, "thanks": 0, "out_of_domain": 0, "request": 0, "unknown": 0}
+        for word in words:
+            if word in self.astronomy:
+                hits["astronomy"] += 1
+            elif word in GREETING_TERMS:
+                hits["greeting"] += 1
+            elif word in THANKS_TERMS:
+                hits["thanks"] += 1
+            elif word in OUT_OF_DOMAIN_TERMS:
+                hits["out_of_domain"] += 1
+            elif word in REQUEST_TERMS:
+                hits["request"] += 1
+            elif word not in FILLER_TERMS:
+                hits["unknown"] += 1
+        if asks and not hits["request"]:
+            hits["request"] = 1  # "is that good?" asks something even without a question word
+
+        if hits["astronomy"]:
+            return Decision("astronomy", 1.0, hits, False)
+        if not words or len(words) > self.max_words:
+            return Decision("unknown", 0.0, hits, False)
+
+        # A greeting that also asks something off-topic is off-topic
+        if hits["out_of_domain"]:
+            label = "out_of_domain"
+            signal = hits["out_of_domain"]
+        elif hits["greeting"] >= hits["thanks"]:
+            label = "greeting"
+            signal = hits["greeting"]
+        else:
+            label = "thanks"
+            signal = hits["thanks"]
+        if not signal:
+            return Decision("unknown", 0.0, hits, False)
+        against = hits["unknown"] + hits["request"]
+        confidence = signal / (signal + self.unknown_weight * against)
+        # A canned greeting/thanks must not swallow a follow-up ("cool, why?"),
+        # nor a canned refusal a question that continues the conversation
+        if label == "out_of_domain":
+            answered = confidence >= self.threshold and not follow_up
+        else:
+            answered = confidence >= self.threshold and not against
+        return Decision(label, round(confidence, 3), hits, answered)
@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import Metrics as metrics
+from metrics.Metrics import StreamTimer
+
+
+class _Attempt:
+    """One model's stream running on a worker thread."""
+
+    def __init__(self, model: str, delay: float = 0.0):
+        self.model = model
+        self.delay = delay  # Upstream pacing wait before opening the stream
+        self.started = time.monotonic() + delay
+        self.timer = StreamTimer(model, self.started)
+        self.stream = None
+        self.cancelled = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()  # Drops the upstream HTTP response
+            except Exception:
+                pass
+
+
+class HedgedStream:
+    """Race model streams, committing to the first one that produces content.
+
+    The first model is started immediately. If it has not produced a content
+    chunk within ``hedge_delay`` seconds, the next model is started alongside
+    it (up to ``max_parallel`` in flight). A model that fails or returns an
+    empty stream makes room for the next one right away. As soon as any
+    attempt yields content it becomes the winner: the others are cancelled
+    and only the winner's chunks are passed on.
+
+    Iterating yields ``(model, content)`` tuples. ``on_error(model, exc)`` is
+    called for every failed attempt; it may re-raise to abort the whole race
+    (e.g. authentication errors). Its return value (a backoff) is ignored
+    here because the race itself replaces the wait. When a ModelHealth is
+    given, every attempt's outcome is recorded in it. ``pace(model)``, if
+    given, returns how long to wait before calling a model, or None to skip
+    it (upstream pacing).
+
+    If the winner fails after streaming content, iteration ends with
+    ``winner`` reset to None and ``interrupted`` naming that model; the
+    caller decides how to finish the partial answer. ``attempted`` lists
+    every model the race called (won, lost, failed or cancelled).
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        open_stream: Callable[[str], object],
+        iter_content: Callable[[object, StreamTimer], Iterable[str]],
+        on_error: Callable[[str, BaseException], float],
+        hedge_delay: float = 3.0,
+        max_parallel: int = 2,
+        health=None,
+        pace: Optional[Callable[[str], Optional[float]]] = None,
+    ):
+        self.models = list(models)
+        self.open_stream = open_stream
+        self.iter_content = iter_content
+        self.on_error = on_error
+        self.hedge_delay = hedge_delay
+        self.max_parallel = max(1, max_parallel)
+        self.health = health  # Optional ModelHealth fed with each attempt's outcome
+        self.pace = pace
+        self.winner: Optional[str] = None
+        self.interrupted: Optional[str] = None  # Winner that failed mid-stream
+
+        self._events: "queue.Queue[Tuple[_Attempt, str, object]]" = queue.Queue()
+        self._attempts: List[_Attempt] = []
+        self._next = 0  # Index in models of the next one to start
+
+    @property
+    def attempted(self) -> List[str]:
+        return [attempt.model for attempt in self._attempts]
+
+    def _run(self, attempt: _Attempt) -> None:
+        try:
+            if attempt.delay and attempt.cancelled.wait(attempt.delay):
+                return
+            attempt.stream = self.open_stream(attempt.model)
+            if attempt.cancelled.is_set():
+                attempt.cancel()
+                return
+            for content in self.iter_content(attempt.stream, attempt.timer):
+                if attempt.cancelled.is_set():
+                    return
+                self._events.put((attempt, "chunk", content))
+            self._events.put((attempt, "done", None))
+        except Exception as e:
+            if not attempt.cancelled.is_set():
+                self._events.put((attempt, "error", e))
+
+    def _start_next(self, hedged: bool = False) -> Optional[_Attempt]:
+        delay = None
+        while delay is None:
+            if self._next >= len(self.models):
+                return None
+            model = self.models[self._next]
+            self._next += 1
+            delay = self.pace(model) if self.pace is not None else 0.0
+        attempt = _Attempt(model, delay)
+        print(f"\n🔄 Trying model: {attempt.model}" + (" (hedged)" if hedged else ""), flush=True)
+        if self.health is not None:
+            self.health.record_attempt(attempt.model)
+        attempt.thread = threading.Thread(target=self._run, args=(attempt,), daemon=True)
+        self._attempts.append(attempt)
+        attempt.thread.start()
+        return attempt
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        in_flight = set()
+        winner: Optional[_Attempt] = None
+        try:
+            first = self._start_next()
+            if first is not None:
+                in_flight.add(first)
+            next_hedge = time.monotonic() + self.hedge_delay
+            while in_flight:
+                timeout = None
+                if winner is None and len(in_flight) < self.max_parallel and self._next < len(self.models):
+                    timeout = max(0.0, next_hedge - time.monotonic())
+                try:
+                    attempt, kind, payload = self._events.get(timeout=timeout)
+                except queue.Empty:
+                    # Deadline passed without a first token: hedge with the next model
+                    started = self._start_next(hedged=True)
+                    if started is not None:
+                        in_flight.add(started)
+                    next_hedge = time.monotonic() + self.hedge_delay
+                    continue
+
+                if attempt not in in_flight:
+                    continue  # Late event from a cancelled loser
+
+                if kind == "chunk":
+                    if winner is None:
+                        winner = attempt
+                        self.winner = attempt.model
+                        for other in in_flight - {attempt}:
+                            print(f"✂️ Cancelling hedged model: {other.model}", flush=True)
+                            other.cancel()
+                            metrics.MODEL_ATTEMPTS.inc(other.model, "cancelled")
+                            if self.health is not None:
+                                self.health.record_cancelled(other.model, time.monotonic() - other.started)
+                        in_flight = {attempt}
+                    yield attempt.model, payload
+                    continue
+
+                in_flight.discard(attempt)
+                if kind == "error":
+                    self.on_error(attempt.model, payload)
+                    if self.health is not None:
+                        self.health.record_failure(attempt.model, payload)
+                    if attempt is winner:
+                        self.winner = None
+                        self.interrupted = attempt.model
+                elif winner is None:
+                    print(f"⚠️ Model {attempt.model} returned an empty stream.", flush=True)
+                    metrics.MODEL_ATTEMPTS.inc(attempt.model, "empty")
+                    if self.health is not None:
+                        self.health.record_failure(attempt.model)
+                elif self.health is not None:
+                    self.health.record_success(attempt.model, attempt.timer.ttft)
+                if winner is None and not in_flight:
+                    # Nothing left running: move on to the next model now
+                    started = self._start_next()
+                    if started is not None:
+                        in_flight.add(started)
+                        next_hedge = time.monotonic() + self.hedge_delay
+        finally:
+            # Also reached when the consumer stops early (client disconnect)
+            for attempt in self._attempts:
+                attempt.cancel()
+                if self.health is not None:
+                    self.health.release(attempt.model)
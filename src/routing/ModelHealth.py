@@ -0,0 +1,192 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+
+from openai import APIStatusError, NotFoundError, PermissionDeniedError, RateLimitError
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """Read a Retry-After header (seconds or HTTP date) from an API error."""
+    response = getattr(e, "response", None) if isinstance(e, APIStatusError) else None
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Health:
+    __slots__ = ("ttft", "error_rate", "state", "open_until", "failures", "trips", "probing",
+                 "successes", "errors")
+
+    def __init__(self):
+        self.ttft: Optional[float] = None  # EWMA time-to-first-token (seconds)
+        self.error_rate = 0.0              # EWMA of 1.0 (failed) / 0.0 (succeeded)
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.failures = 0                  # Consecutive failures
+        self.trips = 0                     # Consecutive times the circuit opened
+        self.probing = False               # A half-open probe is in flight
+        self.successes = 0
+        self.errors = 0
+
+
+class ModelHealth:
+    """Live per-model health shared by every request in this process.
+
+    Fed by the model loop in ChatClient: each attempt ends in
+    ``record_success`` (with its time-to-first-token) or ``record_failure``.
+    A model's circuit opens after ``failure_threshold`` consecutive failures,
+    or immediately for errors that will not go away by themselves (404, 403,
+    429). While open it is skipped for a cooldown (Retry-After when the
+    provider sends one, otherwise exponential from ``base_cooldown``). After
+    the cooldown a single half-open probe request decides whether it closes
+    again.
+
+    ``order(models)`` returns healthy models ranked by EWMA TTFT penalised by
+    error rate, then models due for a probe, then still-open models as a
+    last resort. Models with no samples keep their configured order.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        failure_threshold: int = 3,
+        base_cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+        error_penalty: float = 10.0,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.error_penalty = error_penalty
+        self._models: Dict[str, _Health] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> _Health:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = _Health()
+        return health
+
+    def _ewma(self, old: Optional[float], sample: float) -> float:
+        return sample if old is None else old + self.alpha * (sample - old)
+
+    # --- Ordering ---
+    def order(self, models: List[str]) -> List[str]:
+        """Return ``models`` reordered by live health (see class docstring)."""
+        now = time.monotonic()
+        with self._lock:
+            known = [h.ttft for h in (self._models.get(m) for m in models) if h and h.ttft is not None]
+            default_ttft = sorted(known)[len(known) // 2] if known else 0.0
+
+            def key(item):
+                index, model = item
+                health = self._models.get(model)
+                if health is None:
+                    return (0, default_ttft, index)
+                if health.state == OPEN and now >= health.open_until:
+                    health.state = HALF_OPEN
+                if health.state == CLOSED:
+                    ttft = health.ttft if health.ttft is not None else default_ttft
+                    return (0, ttft + health.error_rate * self.error_penalty, index)
+                if health.state == HALF_OPEN and not health.probing:
+                    return (1, 0.0, index)
+                return (2, health.open_until, index)
+
+            return [model for _, model in sorted(enumerate(models), key=key)]
+
+    # --- Feedback from the model loop ---
+    def record_attempt(self, model: str) -> None:
+        """Mark a request as starting on ``model``; claims the half-open probe."""
+        with self._lock:
+            health = self._models.get(model)
+            if health is not None and health.state == HALF_OPEN:
+                health.probing = True
+
+    def record_success(self, model: str, ttft: float) -> None:
+        with self._lock:
+            health = self._get(model)
+            health.ttft = self._ewma(health.ttft, ttft)
+            health.error_rate = self._ewma(health.error_rate, 0.0)
+            health.successes += 1
+            health.failures = 0
+            health.trips = 0
+            health.probing = False
+            if health.state != CLOSED:
+                print(f"🟢 Circuit closed for model: {model}", flush=True)
+            health.state = CLOSED
+
+    def record_failure(self, model: str, e: Optional[BaseException] = None) -> bool:
+        """Record a failed attempt (``e`` is None for an empty stream).
+
+        Returns True if this failure opened the model's circuit.
+        """
+        retry_after = retry_after_seconds(e) if e is not None else None
+        # These will not go away on the next request, so trip immediately
+        trip_now = isinstance(e, (NotFoundError, PermissionDeniedError, RateLimitError))
+        with self._lock:
+            health = self._get(model)
+            health.error_rate = self._ewma(health.error_rate, 1.0)
+            health.errors += 1
+            health.failures += 1
+            health.probing = False
+            if health.state == HALF_OPEN or trip_now or health.failures >= self.failure_threshold:
+                cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** health.trips))
+                if retry_after is not None:
+                    cooldown = retry_after
+                health.trips += 1
+                health.state = OPEN
+                health.open_until = time.monotonic() + cooldown
+                print(f"🔴 Circuit open for model: {model} ({cooldown:.0f}s)", flush=True)
+                return True
+            return False
+
+    def release(self, model: str) -> None:
+        """Give back a half-open probe slot whose attempt was abandoned
+        (e.g. the client disconnected). Harmless after success or failure."""
+        with self._lock:
+            health = self._models.get(model)
+            if health is not None:
+                health.probing = False
+
+    def record_cancelled(self, model: str, elapsed: float) -> None:
+        """A hedged attempt lost the race after ``elapsed`` seconds without
+        a first token. That is a lower bound on its TTFT, so it can only
+        raise the EWMA; a model that keeps losing drops down the order
+        instead of being tried first (and hedged) on every request."""
+        with self._lock:
+            health = self._get(model)
+            health.probing = False
+            if elapsed > 0 and (health.ttft is None or elapsed > health.ttft):
+                health.ttft = self._ewma(health.ttft, elapsed)
+
+    def stats(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    "state": h.state,
+                    "ttft_ewma": h.ttft,
+                    "error_rate_ewma": h.error_rate,
+                    "successes": h.successes,
+                    "errors": h.errors,
+                    "open_for": max(0.0, h.open_until - now) if h.state == OPEN else 0.0,
+                }
+                for model, h in self._models.items()
+            }
@@ -0,0 +1,167 @@
+import asyncio
+import socket
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+
+class StreamStalled(Exception):
+    """An upstream stream missed its first-token or inter-chunk deadline."""
+
+    def __init__(self, model: str, phase: str, seconds: float):
+        super().__init__(f"No {phase} from {model} within {seconds:g}s")
+        self.model = model
+        self.phase = phase
+        self.seconds = seconds
+
+
+def upstream_timeout(connect: float, first_token: float, stall: float, write: float = 10.0,
+                     pool: float = 5.0) -> httpx.Timeout:
+    """httpx timeouts for model streams.
+
+    The socket read timeout only bounds silence between any two bytes; it is
+    set just above the longer of the two content deadlines as a backstop. The
+    content-level deadlines themselves (keep-alive comments do not count as
+    progress) are enforced by StallWatchdog.
+    """
+    return httpx.Timeout(connect=connect, read=max(first_token, stall) + 1.0, write=write, pool=pool)
+
+
+def upstream_limits(max_connections: int, max_keepalive: int, keepalive_expiry: float) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                        keepalive_expiry=keepalive_expiry)
+
+
+def warm_up(http_client: httpx.Client, url: str, connections: int) -> None:
+    """Open ``connections`` pooled keep-alive connections to ``url`` (DNS,
+    TCP and TLS) so the first questions skip the handshakes. The response
+    status does not matter; failures are only logged."""
+    if connections <= 0:
+        return
+    started = time.monotonic()
+    errors = []
+
+    def touch():
+        try:
+            http_client.head(url)
+        except Exception as e:
+            errors.append(e)
+
+    # Concurrent requests, otherwise they would all reuse one connection
+    threads = [threading.Thread(target=touch, daemon=True) for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    _log_warm_up(connections, errors, started)
+
+
+async def async_warm_up(http_client: httpx.AsyncClient, url: str, connections: int) -> None:
+    """asyncio twin of ``warm_up``; run it on the loop that serves requests."""
+    if connections <= 0:
+        return
+    started = time.monotonic()
+    results = await asyncio.gather(*(http_client.head(url) for _ in range(connections)), return_exceptions=True)
+    _log_warm_up(connections, [r for r in results if isinstance(r, BaseException)], started)
+
+
+def _log_warm_up(connections: int, errors: list, started: float) -> None:
+    if errors:
+        print(f"⚠️ Upstream warm-up: {len(errors)}/{connections} connections failed: {errors[0]}", flush=True)
+    else:
+        print(f"🔥 Warmed {connections} upstream connections in {time.monotonic() - started:.2f}s", flush=True)
+
+
+class _Watch:
+    __slots__ = ("model", "sock", "deadline", "phase", "seconds", "expired")
+
+    def __init__(self, model: str, sock: Optional[socket.socket]):
+        self.model = model
+        self.sock = sock
+        self.deadline = float("inf")
+        self.phase = ""
+        self.seconds = 0.0
+        self.expired = False
+
+    def error(self) -> StreamStalled:
+        return StreamStalled(self.model, self.phase, self.seconds)
+
+
+class StallWatchdog:
+    """Enforce first-token and inter-chunk deadlines on upstream streams.
+
+    One background thread per process checks every watched stream each
+    ``resolution`` seconds. When a deadline passes, the stream's socket is
+    shut down, which wakes the blocked read (sync or asyncio) with an error;
+    the reader then raises ``watch.error()`` instead.
+
+    Readers arm the first-token deadline with ``watch()``, re-arm the stall
+    deadline after every content chunk with ``arm()``, and ``pause()`` the
+    watch while the consumer holds the chunk, so a slow downstream client is
+    not mistaken for a stalled model.
+    """
+
+    def __init__(self, first_token_timeout: float, stall_timeout: float, resolution: float = 0.25):
+        self.first_token_timeout = first_token_timeout
+        self.stall_timeout = stall_timeout
+        self.resolution = resolution
+        self._watches: Dict[int, _Watch] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, stream, model: str) -> _Watch:
+        watch = _Watch(model, _stream_socket(stream))
+        self.arm(watch, self.first_token_timeout, "first token")
+        with self._lock:
+            self._watches[id(watch)] = watch
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stall-watchdog", daemon=True)
+                self._thread.start()
+        return watch
+
+    def arm(self, watch: _Watch, seconds: Optional[float] = None, phase: str = "content chunk") -> None:
+        seconds = self.stall_timeout if seconds is None else seconds
+        watch.phase = phase
+        watch.seconds = seconds
+        watch.deadline = time.monotonic() + seconds if seconds > 0 else float("inf")
+
+    @staticmethod
+    def pause(watch: _Watch) -> None:
+        watch.deadline = float("inf")
+
+    def release(self, watch: _Watch) -> None:
+        with self._lock:
+            self._watches.pop(id(watch), None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.resolution)
+            now = time.monotonic()
+            with self._lock:
+                expired = [w for w in self._watches.values() if w.deadline <= now]
+                for watch in expired:
+                    del self._watches[id(watch)]
+            for watch in expired:
+                watch.expired = True
+                print(f"⏱️ {watch.error()}; aborting the stream", flush=True)
+                if watch.sock is None:
+                    continue  # The socket read timeout will catch it
+                try:
+                    watch.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def _stream_socket(stream) -> Optional[socket.socket]:
+    """The socket under an openai Stream/AsyncStream (httpcore's
+    ``network_stream`` response extension), if there is one."""
+    response = getattr(stream, "response", None)
+    network_stream = getattr(response, "extensions", {}).get("network_stream") if response is not None else None
+    if network_stream is None:
+        return None
+    try:
+        return network_stream.get_extra_info("socket")
+    except Exception:
+        return None
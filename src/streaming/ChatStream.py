@@ -0,0 +1,56 @@
+"""Process-wide /chat_stream plumbing shared by app.py and asgi.py.
+
+Importing this module builds the admission controller and the replay buffer
+(both configured from config.config) but no chat client, so the ASGI entry
+point can share them without constructing app.py's ChatClient.
+"""
+from admission.AdmissionControl import AdmissionController
+from config.config import (
+    SSE_COALESCE_WINDOW_SECONDS, SSE_COALESCE_MAX_CHARS, SSE_HEARTBEAT_SECONDS, SSE_COMPACT,
+    ADMISSION_ENABLED, ADMISSION_MAX_STREAMS, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ADMISSION_MAX_STREAMS_PER_VISITOR, ADMISSION_VISITOR_RATE_PER_MINUTE, ADMISSION_VISITOR_BURST,
+    ADMISSION_IP_RATE_PER_MINUTE, ADMISSION_IP_BURST,
+    SSE_REPLAY_ENABLED, SSE_REPLAY_TTL_SECONDS, SSE_REPLAY_GRACE_SECONDS, SSE_REPLAY_MAX_STREAMS,
+)
+from metrics import Metrics as metrics
+from streaming.ReplayBuffer import ReplayBuffer
+from streaming.SSE import SSEFrameWriter
+
+# Rate limits, concurrent-stream cap and wait queue for /chat_stream
+admission = AdmissionController(
+    max_streams=ADMISSION_MAX_STREAMS,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    max_streams_per_visitor=ADMISSION_MAX_STREAMS_PER_VISITOR,
+    visitor_rate=ADMISSION_VISITOR_RATE_PER_MINUTE / 60.0,
+    visitor_burst=ADMISSION_VISITOR_BURST,
+    ip_rate=ADMISSION_IP_RATE_PER_MINUTE / 60.0,
+    ip_burst=ADMISSION_IP_BURST,
+) if ADMISSION_ENABLED else None
+if admission:
+    metrics.bind_admission(admission)
+
+# Frames of in-flight generations, replayed to EventSource reconnects
+replays = ReplayBuffer(
+    ttl=SSE_REPLAY_TTL_SECONDS,
+    grace=SSE_REPLAY_GRACE_SECONDS,
+    max_streams=SSE_REPLAY_MAX_STREAMS,
+    heartbeat_interval=SSE_HEARTBEAT_SECONDS,
+) if SSE_REPLAY_ENABLED else None
+if replays:
+    metrics.bind_replay(replays)
+
+EXPIRED_STREAM = {
+    'error': "Connection Lost",
+    'message': "The connection dropped and this answer is no longer available. Please ask again.",
+}
+
+
+def new_frame_writer() -> SSEFrameWriter:
+    """SSE frame writer configured from config.config."""
+    return SSEFrameWriter(
+        window=SSE_COALESCE_WINDOW_SECONDS,
+        max_chars=SSE_COALESCE_MAX_CHARS,
+        heartbeat_interval=SSE_HEARTBEAT_SECONDS,
+        compact=SSE_COMPACT,
+    )
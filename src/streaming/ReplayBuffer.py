@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+
+class _Replay:
+    """The frames one /chat_stream generation has produced so far."""
+
+    def __init__(self, stream_id: str, owner: str):
+        self.stream_id = stream_id
+        self.owner = owner  # Conversation id allowed to resume it
+        self.frames: List[str] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.detached_at = time.monotonic()
+        self.superseded = False  # The owner has started a newer generation
+        self.cond = threading.Condition()
+        self._futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _wake(self) -> None:
+        # Caller holds self.cond
+        self.cond.notify_all()
+        for loop, future in self._futures:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+        self._futures.clear()
+
+    def append(self, frame: str) -> None:
+        with self.cond:
+            # The id is what the browser sends back as Last-Event-ID on reconnect
+            self.frames.append(f"id: {self.stream_id}-{len(self.frames) + 1}\n{frame}")
+            self._wake()
+
+    def finish(self) -> None:
+        with self.cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._wake()
+
+    def abandoned(self, grace: float) -> bool:
+        with self.cond:
+            return self.superseded or (self.subscribers == 0 and time.monotonic() - self.detached_at > grace)
+
+    def _attach(self) -> None:
+        with self.cond:
+            self.subscribers += 1
+
+    def _detach(self) -> None:
+        with self.cond:
+            self.subscribers -= 1
+            self.detached_at = time.monotonic()
+
+
+class ReplayBuffer:
+    """Keep in-flight /chat_stream generations replayable for reconnects.
+
+    A generation's SSE frames are produced by a background thread (or task
+    under asgi.py) into a _Replay, and each frame gets an ``id:``
+    ``<stream id>-<n>``. Connections only follow that buffer. When the
+    browser's EventSource loses the connection it reconnects with a
+    ``Last-Event-ID`` header; ``resume`` then replays the frames after that
+    one and follows live, instead of starting a second upstream completion
+    (and recording the question twice in the history).
+
+    With no connection attached, the generation keeps going for ``grace``
+    seconds and is then abandoned. Starting a new generation for the same
+    owner abandons its earlier one right away: the visitor has asked
+    something else, and the old answer must not land in the history after
+    the new question. Finished streams stay replayable for ``ttl`` seconds;
+    at most ``max_streams`` are kept.
+
+    The buffer lives in one process. Under multi-worker gunicorn or uvicorn
+    a reconnect that reaches another worker cannot be resumed and gets the
+    expired-stream error, so resuming needs sticky sessions at the load
+    balancer (or a single worker per instance).
+    """
+
+    HEARTBEAT = ": keep-alive\n\n"
+
+    def __init__(self, ttl: float = 60.0, grace: float = 20.0, max_streams: int = 1000,
+                 heartbeat_interval: float = 15.0):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_streams = max_streams
+        self.heartbeat_interval = heartbeat_interval
+        self._streams: "OrderedDict[str, _Replay]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks: set = set()  # Running _aproduce tasks (the loop only keeps weak references)
+
+    def _create(self, owner: str) -> _Replay:
+        replay = _Replay(uuid.uuid4().hex, owner)
+        replay._attach()
+        now = time.monotonic()
+        with self._lock:
+            for stream_id, old in list(self._streams.items()):
+                if len(self._streams) < self.max_streams and not self._expired(old, now):
+                    break
+                del self._streams[stream_id]
+            superseded = [old for old in self._streams.values() if old.owner == owner and not old.done]
+            self._streams[replay.stream_id] = replay
+        for old in superseded:
+            with old.cond:
+                old.superseded = True
+        return replay
+
+    def _expired(self, replay: _Replay, now: float) -> bool:
+        return replay.done and now - replay.finished_at > self.ttl
+
+    def _lookup(self, last_event_id: str, owner: str) -> Tuple[Optional[_Replay], int]:
+        stream_id, _, seq = last_event_id.strip().rpartition("-")
+        with self._lock:
+            replay = self._streams.get(stream_id)
+        if (replay is None or replay.owner != owner or not seq.isdigit()
+                or self._expired(replay, time.monotonic())):
+            return None, 0
+        replay._attach()
+        return replay, int(seq)
+
+    # --- Producers ---
+
+    def _log_abandon(self, replay: _Replay) -> None:
+        if replay.superseded:
+            print("✂️ A newer question was asked in this conversation; abandoning stream", flush=True)
+        else:
+            print(f"✂️ No client reconnected within {self.grace:g}s; abandoning stream", flush=True)
+
+    def _produce(self, replay: _Replay, frames: Iterator[str]) -> None:
+        try:
+            for frame in frames:
+                # Heartbeats are per connection (see _follow), not replayed
+                if frame.startswith(":"):
+                    frame = None
+                if replay.abandoned(self.grace):
+                    self._log_abandon(replay)
+                    break
+                if frame is not None:
+                    replay.append(frame)
+        finally:
+            frames.close()
+            replay.finish()
+
+    async def _aproduce(self, replay: _Replay, frames: AsyncIterator[str]) -> None:
+        try:
+            async for frame in frames:
+                if frame.startswith(":"):
+                    frame = None
+                if replay.abandoned(self.grace):
+                    self._log_abandon(replay)
+                    break
+                if frame is not None:
+                    replay.append(frame)
+        finally:
+            await frames.aclose()
+            replay.finish()
+
+    def start(self, owner: str, frames: Iterator[str]) -> Iterator[str]:
+        """Run the ``frames`` generator on a background thread and return
+        the first connection's view of it."""
+        replay = self._create(owner)
+        threading.Thread(target=self._produce, args=(replay, frames), name="sse-replay", daemon=True).start()
+        return self._follow(replay, 0)
+
+    def astart(self, owner: str, frames: AsyncIterator[str]) -> AsyncIterator[str]:
+        """asyncio twin of ``start``: ``frames`` runs as a task on the running loop."""
+        replay = self._create(owner)
+        task = asyncio.ensure_future(self._aproduce(replay, frames))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return self._afollow(replay, 0)
+
+    # --- Connections ---
+
+    def resume(self, last_event_id: str, owner: str) -> Optional[Iterator[str]]:
+        """Frames after ``last_event_id`` of a stream of conversation
+        ``owner``, or None if it is unknown or expired."""
+        replay, offset = self._lookup(last_event_id, owner)
+        return None if replay is None else self._follow(replay, offset)
+
+    def aresume(self, last_event_id: str, owner: str) -> Optional[AsyncIterator[str]]:
+        replay, offset = self._lookup(last_event_id, owner)
+        return None if replay is None else self._afollow(replay, offset)
+
+    def _follow(self, replay: _Replay, index: int) -> Iterator[str]:
+        try:
+            while True:
+                with replay.cond:
+                    if index >= len(replay.frames) and not replay.done:
+                        replay.cond.wait(self.heartbeat_interval or None)
+                    pending = replay.frames[index:]
+                    index += len(pending)
+                    finished = replay.done and index >= len(replay.frames)
+                if pending:
+                    yield "".join(pending)
+                elif not finished:
+                    yield self.HEARTBEAT
+                if finished:
+                    return
+        finally:
+            replay._detach()
+
+    async def _afollow(self, replay: _Replay, index: int) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                future = None
+                with replay.cond:
+                    if index >= len(replay.frames) and not replay.done:
+                        future = loop.create_future()
+                        replay._futures.append((loop, future))
+                if future is not None:
+                    try:
+                        await asyncio.wait_for(future, self.heartbeat_interval or None)
+                    except asyncio.TimeoutError:
+                        pass
+                with replay.cond:
+                    pending = replay.frames[index:]
+                    index += len(pending)
+                    finished = replay.done and index >= len(replay.frames)
+                if pending:
+                    yield "".join(pending)
+                elif not finished:
+                    yield self.HEARTBEAT
+                if finished:
+                    return
+        finally:
+            replay._detach()
+
+    def stats(self) -> dict:
+        with self._lock:
+            streams = list(self._streams.values())
+        return {"streams": len(streams), "in_flight": sum(not r.done for r in streams)}
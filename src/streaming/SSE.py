@@ -0,0 +1,206 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
+
+from openai import AuthenticationError, BadRequestError
+
+from admission.AdmissionControl import AdmissionRejected
+
+
+class _StreamReset(str):
+    pass
+
+
+# Yielded by ChatClient in place of a content chunk when the text streamed so
+# far must be discarded (a model failed mid-answer and the next one starts
+# over). It is an empty string, so joining chunks ignores it; compare with
+# ``is``. SSEFrameWriter turns it into an `event: reset` frame.
+STREAM_RESET = _StreamReset()
+
+
+def format_event(data, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame with a JSON-encoded payload."""
+    if event:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def error_payload(exc: BaseException) -> dict:
+    """Map an exception raised while streaming to the `error` event payload
+    that templates/chat.html displays, logging it server-side."""
+    if isinstance(exc, AdmissionRejected):  # Over a rate limit or capacity
+        print(f"🚧 Admission rejected ({exc.reason}): {exc}", flush=True)
+        return {'error': "Server Busy", 'message': str(exc), 'retry_after': round(exc.retry_after, 1)}
+    if isinstance(exc, (AuthenticationError, BadRequestError)):
+        print(f"SSE Stream Error (Critical): {exc}")
+        return {'error': f"API Error: {type(exc).__name__}", 'message': str(exc)}
+    if isinstance(exc, RuntimeError):  # the "all models failed" error
+        print(f"SSE Stream Error (Runtime): {exc}")
+        return {'error': "Runtime Error", 'message': str(exc)}
+    print(f"SSE Stream Error (Unexpected): {exc}")
+    import traceback
+    traceback.print_exception(exc)
+    return {'error': "Unexpected Server Error", 'message': "An error occurred while generating the response."}
+
+
+class SSEFrameWriter:
+    """Turn a stream of content deltas into SSE frames for /chat_stream.
+
+    Deltas are coalesced: a data frame is written once ``max_chars`` of text
+    are buffered or ``window`` seconds after the first buffered delta,
+    whichever comes first (``window=0`` writes every delta immediately).
+    While nothing is written for ``heartbeat_interval`` seconds (e.g. during
+    model fallback) an SSE comment frame keeps proxies from timing out;
+    EventSource ignores comments. ``compact`` drops the optional space after
+    ``data:`` and sends non-ASCII text as UTF-8 instead of ``\\uXXXX`` escapes.
+
+    The cid/end/error events and the JSON string payload of data frames are
+    unchanged. ``STREAM_RESET`` in the chunk stream becomes an `event: reset`
+    frame telling the client to clear the partial answer.
+    """
+
+    HEARTBEAT = ": keep-alive\n\n"
+
+    def __init__(self, window: float = 0.05, max_chars: int = 1024, heartbeat_interval: float = 15.0,
+                 compact: bool = False):
+        self.window = window
+        self.max_chars = max_chars
+        self.heartbeat_interval = heartbeat_interval
+        self.compact = compact
+
+    def event(self, data, event: Optional[str] = None) -> str:
+        if not self.compact:
+            return format_event(data, event)
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        if event:
+            return f"event:{event}\ndata:{payload}\n\n"
+        return f"data:{payload}\n\n"
+
+    def _timeout(self, buffered: bool, deadline: float, last_write: float) -> Optional[float]:
+        now = time.monotonic()
+        if buffered:
+            return max(0.0, deadline - now)
+        if self.heartbeat_interval:
+            return max(0.0, last_write + self.heartbeat_interval - now)
+        return None
+
+    def stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Frames for a (blocking) chunk iterator, read on a helper thread so
+        heartbeats and window flushes happen even while upstream is silent.
+        Exceptions from ``chunks`` are re-raised after buffered text is sent."""
+        events: "queue.Queue[tuple]" = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        break
+                    events.put(("chunk", chunk))
+                events.put(("end", None))
+            except BaseException as e:
+                events.put(("error", e))
+            finally:
+                if stop.is_set() and hasattr(chunks, "close"):
+                    chunks.close()
+
+        threading.Thread(target=pump, name="sse-pump", daemon=True).start()
+        buffer: List[str] = []
+        buffered = 0
+        deadline = last_write = time.monotonic()
+        try:
+            while True:
+                try:
+                    kind, payload = events.get(timeout=self._timeout(bool(buffer), deadline, last_write))
+                except queue.Empty:
+                    if buffer:
+                        yield self.event("".join(buffer))
+                        buffer, buffered = [], 0
+                    else:
+                        yield self.HEARTBEAT
+                    last_write = time.monotonic()
+                    continue
+
+                if kind == "chunk":
+                    if payload is STREAM_RESET:
+                        # Unsent text is part of what the client discards
+                        buffer, buffered = [], 0
+                        yield self.event({}, 'reset')
+                        last_write = time.monotonic()
+                        continue
+                    if not buffer:
+                        deadline = time.monotonic() + self.window
+                    buffer.append(payload)
+                    buffered += len(payload)
+                    if buffered >= self.max_chars or self.window <= 0:
+                        yield self.event("".join(buffer))
+                        buffer, buffered = [], 0
+                        last_write = time.monotonic()
+                    continue
+
+                if buffer:
+                    yield self.event("".join(buffer))
+                if kind == "error":
+                    raise payload
+                return
+        finally:
+            stop.set()
+
+    async def astream(self, chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+        """asyncio twin of ``stream`` for asgi.py."""
+        iterator = chunks.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        buffer: List[str] = []
+        buffered = 0
+        deadline = last_write = time.monotonic()
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=self._timeout(bool(buffer), deadline, last_write))
+                if not done:
+                    if buffer:
+                        yield self.event("".join(buffer))
+                        buffer, buffered = [], 0
+                    else:
+                        yield self.HEARTBEAT
+                    last_write = time.monotonic()
+                    continue
+
+                future, pending = pending, None
+                try:
+                    chunk = future.result()
+                except StopAsyncIteration:
+                    if buffer:
+                        yield self.event("".join(buffer))
+                    return
+                except BaseException:
+                    if buffer:
+                        yield self.event("".join(buffer))
+                    raise
+
+                if chunk is STREAM_RESET:
+                    buffer, buffered = [], 0
+                    yield self.event({}, 'reset')
+                    last_write = time.monotonic()
+                    continue
+                if not buffer:
+                    deadline = time.monotonic() + self.window
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered >= self.max_chars or self.window <= 0:
+                    yield self.event("".join(buffer))
+                    buffer, buffered = [], 0
+                    last_write = time.monotonic()
+        finally:
+            if pending is not None:
+                pending.cancel()
+                try:
+                    await pending
+                except BaseException:
+                    pass
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
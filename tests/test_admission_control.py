@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from admission.AdmissionControl import AdmissionController, AdmissionRejected
+
+
+def controller(**kwargs):
+    # Rate limits off unless a test sets them: these tests are about slots
+    kwargs.setdefault("visitor_rate", 0)
+    kwargs.setdefault("ip_rate", 0)
+    return AdmissionController(**kwargs)
+
+
+def idle(admission):
+    return admission.stats() == {"active": 0, "queued": 0, "visitors": 0}
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def rejection(reason, call, *args):
+    with pytest.raises(AdmissionRejected) as info:
+        call(*args)
+    assert info.value.reason == reason
+    return info.value
+
+
+def test_released_slot_goes_to_the_oldest_waiter():
+    admission = controller(max_streams=1, max_queue=4, queue_timeout=5)
+    holder = admission.admit("a", "ip")
+    order = []
+
+    def wait(visitor):
+        with admission.admit(visitor, "ip"):
+            order.append(visitor)
+
+    first = threading.Thread(target=wait, args=("b",))
+    first.start()
+    wait_for(lambda: admission.stats()["queued"] == 1)
+    second = threading.Thread(target=wait, args=("c",))
+    second.start()
+    wait_for(lambda: admission.stats()["queued"] == 2)
+    holder.release()
+    first.join(2)
+    second.join(2)
+    assert order == ["b", "c"]
+    assert idle(admission)
+
+
+def test_ticket_release_is_idempotent():
+    admission = controller(max_streams=2)
+    ticket = admission.admit("a", "ip")
+    other = admission.admit("b", "ip")
+    ticket.release()
+    ticket.release()
+    assert admission.stats() == {"active": 1, "queued": 0, "visitors": 1}
+    other.release()
+    assert idle(admission)
+
+
+def test_queue_timeout_forgets_the_waiter():
+    admission = controller(max_streams=1, queue_timeout=0.05)
+    holder = admission.admit("a", "ip")
+    error = rejection("queue_timeout", admission.admit, "b", "ip")
+    assert error.retry_after == 0.05
+    assert admission.stats() == {"active": 1, "queued": 0, "visitors": 1}
+    holder.release()
+    assert idle(admission)
+
+
+def test_full_queue_and_per_visitor_limit_reject_right_away():
+    admission = controller(max_streams=1, max_queue=0, max_streams_per_visitor=1)
+    with admission.admit("a", "ip"):
+        rejection("visitor_streams", admission.admit, "a", "ip")
+        rejection("queue_full", admission.admit, "b", "ip")
+    assert idle(admission)
+    admission.admit("a", "ip").release()  # The visitor's stream count was given back
+
+
+def test_rate_limits_are_checked_per_ip_and_visitor():
+    admission = AdmissionController(visitor_rate=0.1, visitor_burst=1, ip_rate=0.1, ip_burst=2)
+    admission.admit("a", "ip").release()
+    error = rejection("visitor_rate", admission.admit, "a", "ip")
+    assert error.retry_after == pytest.approx(10.0, abs=0.1)
+    rejection("ip_rate", admission.admit, "b", "ip")
+    admission.admit("c", "other-ip").release()
+    assert idle(admission)
+
+
+def test_async_waiter_cancelled_in_the_queue_leaks_nothing():
+    admission = controller(max_streams=1, queue_timeout=5)
+
+    async def scenario():
+        holder = await admission.admit_async("a", "ip")
+        waiter = asyncio.ensure_future(admission.admit_async("b", "ip"))
+        while admission.stats()["queued"] < 1:
+            await asyncio.sleep(0)
+        waiter.cancel()  # Client disconnect while queued
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        holder.release()
+
+    asyncio.run(scenario())
+    assert idle(admission)
+
+
+def test_async_slot_granted_just_before_cancellation_is_released():
+    admission = controller(max_streams=1, queue_timeout=5)
+
+    async def scenario():
+        holder = await admission.admit_async("a", "ip")
+        waiter = asyncio.ensure_future(admission.admit_async("b", "ip"))
+        while admission.stats()["queued"] < 1:
+            await asyncio.sleep(0)
+        holder.release()  # Grants b's slot ...
+        waiter.cancel()  # ... but b goes away before it wakes up
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    assert idle(admission)
+
+
+def test_async_queue_timeout():
+    admission = controller(max_streams=1, queue_timeout=0.05)
+
+    async def scenario():
+        with await admission.admit_async("a", "ip"):
+            with pytest.raises(AdmissionRejected) as info:
+                await admission.admit_async("b", "ip")
+            assert info.value.reason == "queue_timeout"
+
+    asyncio.run(scenario())
+    assert idle(admission)
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from batch import BatchRunner, ResultWriter, read_results
+
+
+class FakeHistories:
+    def __init__(self):
+        self.turns = {}
+
+    @contextmanager
+    def lock(self, conversation_id):
+        yield
+
+    def append(self, conversation_id, *messages):
+        self.turns.setdefault(conversation_id, []).extend(messages)
+
+
+class FakeClient:
+    """Answers every question except those listed in ``fail``."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.asked = []
+        self.histories = FakeHistories()
+
+    def get_history(self, conversation_id):
+        return self.histories.turns.get(conversation_id, [])
+
+    def chat_with_model_stream(self, question, conversation_id, outcome):
+        self.asked.append(question)
+        if question in self.fail:
+            raise RuntimeError("Failed to get a response from any configured model.")
+        outcome.update(model="fake", source="upstream")
+        yield f"answer to {question}"
+        self.histories.append(conversation_id, {"role": "user", "content": question},
+                              {"role": "assistant", "content": f"answer to {question}"})
+
+
+def run(tmp_path, client, items):
+    output = str(tmp_path / "out.jsonl")
+    writer = ResultWriter(output)
+    runner = BatchRunner(client, writer, read_results(output), concurrency=2)
+    runner.run(iter(items))
+    writer.close()
+    return runner, output
+
+
+def items():
+    return [{"id": str(n), "line": n, "question": f"q{n}", "conversation_id": "c"} for n in range(1, 5)]
+
+
+def test_chain_stops_at_first_failed_turn_and_resumes_in_order(tmp_path):
+    client = FakeClient(fail={"q2"})
+    runner, output = run(tmp_path, client, items())
+    assert client.asked == ["q1", "q2"]
+    assert runner.counts == {"ok": 1, "failed": 1, "blocked": 2, "skipped": 0}
+    with open(output) as f:
+        records = [json.loads(line) for line in f]
+    assert [r["error"] is None for r in records] == [True, False, False, False]
+
+    # The rerun asks the failed turn and everything after it, in order, with turn 1 restored
+    client = FakeClient()
+    runner, _ = run(tmp_path, client, items())
+    assert client.asked == ["q2", "q3", "q4"]
+    assert runner.counts == {"ok": 3, "failed": 0, "blocked": 0, "skipped": 1}
+    assert client.histories.turns["c"][0] == {"role": "user", "content": "q1"}
@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from routing.DomainFilter import DomainFilter
+
+
+# (message, expected label, answered locally?)
+CASES = [
+    # Bare greetings and thanks get the canned reply
+    ("hi", "greeting", True),
+    ("Hello there!", "greeting", True),
+    ("good morning", "greeting", True),
+    ("hey, how are you?", "greeting", True),
+    ("thanks a lot", "thanks", True),
+    ("thank you so much", "thanks", True),
+    ("ok", "thanks", True),
+    ("good evening", "greeting", True),
+    ("nice to meet you", "greeting", True),
+    # Bare acknowledgements are thanks, never a greeting
+    ("nice", "thanks", True),
+    ("very good", "thanks", True),
+    ("good", "thanks", True),
+    ("is that good?", "thanks", False),
+    ("good, and the next one?", "thanks", False),
+    # Follow-ups that open with a pleasantry must reach the model
+    ("ok tell me more", "thanks", False),
+    ("cool, why?", "thanks", False),
+    ("great, explain more", "thanks", False),
+    ("ok explain it", "thanks", False),
+    ("okay, and then?", "thanks", False),
+    ("Hi, who is Wilson?", "greeting", False),
+    ("tell me more", "unknown", False),
+    ("why?", "unknown", False),
+    # Clearly off-topic
+    ("What is a good pizza recipe?", "out_of_domain", True),
+    ("how do I debug python code", "out_of_domain", True),
+    ("is bitcoin a good investment", "out_of_domain", True),
+    # Ambiguous off-topic goes upstream
+    ("what is the best pizza in town", "out_of_domain", False),
+    ("who won the football match", "out_of_domain", False),
+    ("Write me a poem about love", "out_of_domain", False),
+    ("what is the meaning of life", "unknown", False),
+    # Anything mentioning astronomy goes upstream
+    ("how far is the moon", "astronomy", False),
+    ("What is dark matter made of", "astronomy", False),
+    ("thanks! what about saturn?", "astronomy", False),
+    ("hi, what is a pulsar", "astronomy", False),
+]
+
+
+@pytest.mark.parametrize("message,label,answered", CASES)
+def test_classify(message, label, answered):
+    decision = DomainFilter(threshold=0.75).classify(message)
+    assert (decision.label, decision.answered) == (label, answered), decision.hits
+
+
+def test_long_messages_go_upstream():
+    decision = DomainFilter(max_words=5).classify("pizza recipe pasta recipe cake recipe please")
+    assert decision.label == "unknown" and not decision.answered
+
+
+def test_extra_astronomy_terms():
+    decision = DomainFilter(extra_astronomy_terms=["Betelgeuse"]).classify("football near betelgeuse")
+    assert decision.label == "astronomy" and not decision.answered
+
+
+# Short follow-ups in a running conversation: (message, answered as first turn?)
+FOLLOW_UPS = [
+    ("and for cars?", False),
+    ("and the pizza recipe?", True),
+    ("how do I debug python code", True),
+]
+
+
+@pytest.mark.parametrize("message,first_turn_answered", FOLLOW_UPS)
+def test_off_topic_follow_ups_go_upstream(message, first_turn_answered):
+    domain_filter = DomainFilter(threshold=0.75)
+    assert domain_filter.classify(message).answered == first_turn_answered
+    decision = domain_filter.classify(message, follow_up=True)
+    assert decision.label == "out_of_domain" and not decision.answered
+
+
+@pytest.mark.parametrize("message", ["ok", "thanks", "nice", "hello"])
+def test_pleasantries_are_answered_in_any_turn(message):
+    assert DomainFilter().classify(message, follow_up=True).answered
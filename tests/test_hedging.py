@@ -0,0 +1,165 @@
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from routing.Hedging import HedgedStream
+
+_END = object()
+
+
+class FakeStream:
+    """A model stream the test feeds chunk by chunk; closing it unblocks the reader."""
+
+    def __init__(self):
+        self.chunks: "queue.Queue" = queue.Queue()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get(timeout=5)
+            if chunk is _END or self.closed.is_set():
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+
+    def close(self):
+        self.closed.set()
+        self.chunks.put(_END)
+
+
+class FakeUpstream:
+    def __init__(self, *models):
+        self.streams = {model: FakeStream() for model in models}
+        self.opened = []
+        self.errors = []
+
+    def open_stream(self, model):
+        self.opened.append(model)
+        return self.streams[model]
+
+    @staticmethod
+    def iter_content(stream, timer):
+        return iter(stream)
+
+    def on_error(self, model, e):
+        self.errors.append((model, e))
+        return 0
+
+
+class FakeHealth:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if not name.startswith("record_") and name != "release":
+            raise AttributeError(name)
+        return lambda model, *args: self.calls.append((name, model))
+
+
+def race(upstream, models, **kwargs):
+    kwargs.setdefault("hedge_delay", 60)
+    return HedgedStream(models, upstream.open_stream, upstream.iter_content, upstream.on_error, **kwargs)
+
+
+def test_first_model_to_answer_wins_and_cancels_the_others():
+    upstream, health = FakeUpstream("a", "b"), FakeHealth()
+    hedged = race(upstream, ["a", "b"], hedge_delay=0, health=health)
+    chunks = iter(hedged)
+    upstream.streams["b"].chunks.put("fast")
+    assert next(chunks) == ("b", "fast")
+    assert hedged.winner == "b"
+    assert upstream.streams["a"].closed.is_set()
+    assert ("record_cancelled", "a") in health.calls
+
+    upstream.streams["a"].chunks.put("too late")  # Never passed on
+    upstream.streams["b"].chunks.put(" answer")
+    upstream.streams["b"].chunks.put(_END)
+    assert list(chunks) == [("b", " answer")]
+    assert hedged.attempted == ["a", "b"]
+    assert ("record_success", "b") in health.calls
+
+
+def test_failed_model_starts_the_next_one_without_waiting_for_the_hedge():
+    upstream = FakeUpstream("a", "b")
+    hedged = race(upstream, ["a", "b"])
+    chunks = iter(hedged)
+    upstream.streams["a"].chunks.put(ConnectionError("reset"))
+    upstream.streams["b"].chunks.put("hi")
+    upstream.streams["b"].chunks.put(_END)
+    assert list(chunks) == [("b", "hi")]
+    assert [model for model, _ in upstream.errors] == ["a"]
+    assert hedged.attempted == ["a", "b"]
+
+
+def test_consumer_leaving_cancels_and_releases_every_attempt():
+    upstream, health = FakeUpstream("a", "b", "c"), FakeHealth()
+    hedged = race(upstream, ["a", "b", "c"], hedge_delay=0, health=health)
+    chunks = iter(hedged)
+    upstream.streams["a"].chunks.put("x")
+    assert next(chunks) == ("a", "x")
+    chunks.close()  # Client disconnect
+    assert all(upstream.streams[m].closed.is_set() for m in hedged.attempted)
+    assert sorted(m for name, m in health.calls if name == "release") == sorted(hedged.attempted)
+    assert "c" not in upstream.opened
+
+
+def test_winner_failing_mid_stream_is_reported_as_interrupted():
+    upstream, health = FakeUpstream("a", "b"), FakeHealth()
+    hedged = race(upstream, ["a", "b"], health=health)
+    chunks = iter(hedged)
+    upstream.streams["a"].chunks.put("part")
+    upstream.streams["a"].chunks.put(ConnectionError("reset"))
+    assert list(chunks) == [("a", "part")]
+    assert hedged.winner is None
+    assert hedged.interrupted == "a"
+    assert ("record_failure", "a") in health.calls
+    assert upstream.opened == ["a"]
+
+
+def test_paced_out_models_are_skipped():
+    upstream = FakeUpstream("a", "b")
+    hedged = race(upstream, ["a", "b"], pace=lambda model: None if model == "a" else 0.0)
+    chunks = iter(hedged)
+    upstream.streams["b"].chunks.put("ok")
+    upstream.streams["b"].chunks.put(_END)
+    assert list(chunks) == [("b", "ok")]
+    assert hedged.attempted == ["b"]
+
+
+def test_client_fallback_skips_every_model_the_race_called(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-test")
+    import ChatClient as chat_client_module
+    monkeypatch.setattr(chat_client_module, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(chat_client_module, "HEDGE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(chat_client_module, "HEDGE_MAX_PARALLEL", 2)
+    monkeypatch.setattr(chat_client_module, "STREAM_FAILOVER_MODE", "continue")
+    client = chat_client_module.ChatClient()
+    client.pacer = None
+    client.health = None
+    upstream = FakeUpstream("a", "b", "c")
+
+    def open_stream(model, messages):
+        if model == "b":
+            upstream.streams["a"].chunks.put("part ")  # a wins once b has joined the race
+        return upstream.open_stream(model)
+
+    client._open_model_stream = open_stream
+    client._iter_content = upstream.iter_content
+
+    outcome = {}
+    stream = client._stream_models([{"role": "user", "content": "q"}], ["a", "b", "c"], outcome)
+    assert next(stream) == "part "
+    upstream.streams["a"].chunks.put(ConnectionError("reset"))
+    upstream.streams["c"].chunks.put("rest")
+    upstream.streams["c"].chunks.put(_END)
+    assert list(stream) == ["rest"]
+    assert outcome["model"] == "c"
+    assert upstream.opened == ["a", "b", "c"]  # b lost the race and is not called again
@@ -0,0 +1,16 @@
+import os
+import sys
+
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-test")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app as app_module
+from metrics import Metrics as metrics
+
+
+def test_metrics_content_type_has_a_single_charset():
+    app_module.app.config['CHAT_CLIENT_ENABLED'] = False  # No ChatClient (or warm-up) needed here
+    response = app_module.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == "text/plain; version=0.0.4; charset=utf-8"
+    assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
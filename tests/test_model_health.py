@@ -0,0 +1,129 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+import routing.ModelHealth as model_health
+from routing.ModelHealth import CLOSED, HALF_OPEN, OPEN, ModelHealth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(model_health, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+def trip(health, model, failures=3):
+    for _ in range(failures):
+        health.record_attempt(model)
+        health.record_failure(model, RuntimeError("boom"))
+
+
+def test_circuit_opens_after_threshold_and_sinks_in_order(clock):
+    health = ModelHealth(failure_threshold=3, base_cooldown=30)
+    trip(health, "a", failures=2)
+    assert health.stats()["a"]["state"] == CLOSED
+    trip(health, "a", failures=1)
+    assert health.stats()["a"]["state"] == OPEN
+    assert health.order(["a", "b"]) == ["b", "a"]
+
+
+def test_half_open_probe_is_claimed_once_and_released(clock):
+    health = ModelHealth(failure_threshold=1, base_cooldown=30)
+    trip(health, "a", failures=1)
+    clock.now += 31
+    # Due for a probe: ranked after healthy models, before still-open ones
+    assert health.order(["a", "b"]) == ["b", "a"]
+    assert health._models["a"].state == HALF_OPEN
+
+    health.record_attempt("a")  # This request is the probe
+    assert health._models["a"].probing
+    # An abandoned probe (client disconnect) gives the slot back
+    health.release("a")
+    assert not health._models["a"].probing
+    assert health._models["a"].state == HALF_OPEN
+
+
+def test_failed_probe_reopens_with_longer_cooldown(clock):
+    health = ModelHealth(failure_threshold=1, base_cooldown=30, max_cooldown=600)
+    trip(health, "a", failures=1)
+    clock.now += 31
+    health.order(["a"])
+    trip(health, "a", failures=1)
+    assert health.stats()["a"]["state"] == OPEN
+    assert health.stats()["a"]["open_for"] == pytest.approx(60)
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    health = ModelHealth(failure_threshold=1, base_cooldown=30)
+    trip(health, "a", failures=1)
+    clock.now += 31
+    health.order(["a"])
+    health.record_attempt("a")
+    health.record_success("a", 0.5)
+    assert health.stats()["a"]["state"] == CLOSED
+    assert not health._models["a"].probing
+
+
+def test_cancelled_hedge_only_raises_ttft(clock):
+    health = ModelHealth(alpha=0.5)
+    health.record_success("a", 1.0)
+    health.record_cancelled("a", 0.2)  # Lost quickly: says nothing about being slow
+    assert health.stats()["a"]["ttft_ewma"] == pytest.approx(1.0)
+    health.record_cancelled("a", 3.0)
+    assert health.stats()["a"]["ttft_ewma"] == pytest.approx(2.0)
+
+
+def test_model_that_keeps_losing_drops_down_the_order(clock):
+    health = ModelHealth(alpha=0.5)
+    health.record_success("a", 0.5)
+    health.record_success("b", 1.0)
+    assert health.order(["a", "b"]) == ["a", "b"]
+    for _ in range(3):
+        health.record_cancelled("a", 2.0)
+    assert health.order(["a", "b"]) == ["b", "a"]
+
+
+def test_cancelled_probe_releases_the_slot(clock):
+    health = ModelHealth(failure_threshold=1, base_cooldown=30)
+    trip(health, "a", failures=1)
+    clock.now += 31
+    health.order(["a"])
+    health.record_attempt("a")
+    health.record_cancelled("a", 1.0)
+    assert not health._models["a"].probing
+
+
+def test_client_disconnect_releases_the_probe(clock, monkeypatch):
+    # GeneratorExit bypasses the model loop's ``except Exception``; the probe must still be released
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-test")
+    import ChatClient as chat_client_module
+    monkeypatch.setattr(chat_client_module, "HEDGE_ENABLED", False)
+    client = chat_client_module.ChatClient()
+    client.pacer = None
+    client.health = ModelHealth(failure_threshold=1, base_cooldown=30)
+    trip(client.health, "a", failures=1)
+    clock.now += 31
+    client.health.order(["a"])
+    client._open_model_stream = lambda model, messages: object()
+    client._iter_content = lambda stream, timer: iter(["part one", "part two"])
+
+    stream = client._stream_models([{"role": "user", "content": "q"}], ["a"], {})
+    assert next(stream) == "part one"
+    assert client.health._models["a"].probing
+    stream.close()  # The browser went away mid-answer
+    assert not client.health._models["a"].probing
@@ -0,0 +1,84 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+import admission.RateLimiter as rate_limiter
+from admission.RateLimiter import KeyedRateLimiter, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_burst_then_reject_with_retry_after(clock):
+    limiter = RateLimiter(rate=0.5, burst=2)
+    assert limiter.reserve("v") == (True, 0.0)
+    assert limiter.reserve("v") == (True, 0.0)
+    assert limiter.reserve("v") == (False, pytest.approx(2.0))
+    assert limiter.reserve("other") == (True, 0.0)  # Buckets are per key
+    clock.now += 2
+    assert limiter.reserve("v") == (True, 0.0)
+
+
+def test_rejection_takes_nothing(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.reserve("v")
+    for _ in range(5):
+        assert not limiter.reserve("v")[0]
+    clock.now += 1
+    assert limiter.reserve("v") == (True, 0.0)
+
+
+def test_reservations_within_max_wait_queue_behind_each_other(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.reserve("m", max_wait=5) == (True, 0.0)
+    assert limiter.reserve("m", max_wait=5) == (True, pytest.approx(1.0))
+    assert limiter.reserve("m", max_wait=5) == (True, pytest.approx(2.0))
+    assert limiter.reserve("m", max_wait=1.5) == (False, pytest.approx(3.0))
+
+
+def test_refill_is_capped_at_burst(clock):
+    limiter = RateLimiter(rate=1, burst=2)
+    clock.now += 3600
+    assert all(limiter.reserve("v")[0] for _ in range(2))
+    assert not limiter.reserve("v")[0]
+
+
+def test_least_recently_seen_keys_are_dropped(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    limiter.reserve("a")
+    limiter.reserve("b")
+    limiter.reserve("a", max_wait=5)  # Refreshes a
+    limiter.reserve("c")
+    assert len(limiter) == 2
+    assert limiter.reserve("b") == (True, 0.0)  # Forgotten: full bucket again
+
+
+def test_zero_rate_disables_the_limiter(clock):
+    limiter = RateLimiter(rate=0, burst=1)
+    assert all(limiter.reserve("v") == (True, 0.0) for _ in range(100))
+    assert len(limiter) == 0
+
+
+def test_keyed_limiter_uses_each_key_rate(clock):
+    limiter = KeyedRateLimiter({"slow": 0.1}, default_rate=10, burst=1)
+    assert limiter.reserve("slow")[0] and limiter.reserve("fast")[0]
+    assert limiter.reserve("slow") == (False, pytest.approx(10.0))
+    assert limiter.reserve("fast") == (False, pytest.approx(0.1))
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import queue
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+import streaming.ReplayBuffer as replay_buffer
+from streaming.ReplayBuffer import ReplayBuffer
+
+_END = object()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(replay_buffer, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+class FakeFrames:
+    """A /chat_stream frame generator the test feeds frame by frame."""
+
+    def __init__(self):
+        self.frames: "queue.Queue" = queue.Queue()
+        self.closed = threading.Event()
+        self.generator = self._generate()
+
+    def _generate(self):
+        try:
+            while True:
+                frame = self.frames.get(timeout=5)
+                if frame is _END:
+                    return
+                yield frame
+        finally:
+            self.closed.set()
+
+    def feed(self, *frames):
+        for frame in frames:
+            self.frames.put(frame)
+
+
+def data(text):
+    return f"data: {text}\n\n"
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def only_replay(replays):
+    (replay,) = replays._streams.values()
+    return replay
+
+
+def test_reconnect_resumes_after_last_event_id(clock):
+    replays, source = ReplayBuffer(heartbeat_interval=0), FakeFrames()
+    first = replays.start("cid", source.generator)
+    source.feed(data("a"))
+    frame = next(first)
+    assert frame.endswith(data("a"))
+    last_event_id = frame.split("\n", 1)[0][len("id: "):]
+    first.close()  # The connection drops
+
+    source.feed(data("b"), data("c"), _END)
+    replay = only_replay(replays)
+    wait_for(lambda: replay.done)
+    resumed = "".join(replays.resume(last_event_id, "cid"))
+    assert resumed == f"id: {replay.stream_id}-2\n{data('b')}id: {replay.stream_id}-3\n{data('c')}"
+    assert replay.subscribers == 0
+
+
+def test_resume_refuses_foreign_unknown_and_expired_streams(clock):
+    replays, source = ReplayBuffer(ttl=60, heartbeat_interval=0), FakeFrames()
+    first = replays.start("cid", source.generator)
+    source.feed(data("a"), _END)
+    assert list(first) == [f"id: {only_replay(replays).stream_id}-1\n{data('a')}"]
+    stream_id = only_replay(replays).stream_id
+
+    assert replays.resume(f"{stream_id}-1", "someone-else") is None
+    assert replays.resume("unknown-1", "cid") is None
+    assert replays.resume(stream_id, "cid") is None  # No sequence number
+    assert list(replays.resume(f"{stream_id}-0", "cid")) == [f"id: {stream_id}-1\n{data('a')}"]
+    clock.now += 61
+    assert replays.resume(f"{stream_id}-1", "cid") is None
+
+
+def test_heartbeats_are_sent_per_connection_not_stored(clock):
+    replays, source = ReplayBuffer(heartbeat_interval=0.01), FakeFrames()
+    first = replays.start("cid", source.generator)
+    assert next(first) == ReplayBuffer.HEARTBEAT  # Nothing produced yet
+    source.feed(ReplayBuffer.HEARTBEAT, data("a"), _END)
+    assert [f for f in first if f != ReplayBuffer.HEARTBEAT] == [f"id: {only_replay(replays).stream_id}-1\n{data('a')}"]
+    assert len(only_replay(replays).frames) == 1
+
+
+def test_generation_is_abandoned_after_the_grace_period(clock):
+    replays, source = ReplayBuffer(grace=20, heartbeat_interval=0), FakeFrames()
+    first = replays.start("cid", source.generator)
+    source.feed(data("a"))
+    next(first)
+    first.close()
+    replay = only_replay(replays)
+
+    clock.now += 10  # Still within the grace period: keeps producing for a reconnect
+    source.feed(data("b"))
+    wait_for(lambda: len(replay.frames) == 2)
+    clock.now += 11
+    source.feed(data("c"))
+    assert source.closed.wait(2)
+    wait_for(lambda: replay.done)
+    assert len(replay.frames) == 2
+    assert replays.stats() == {"streams": 1, "in_flight": 0}
+
+
+def test_new_question_supersedes_the_owner_earlier_stream(clock):
+    replays = ReplayBuffer(heartbeat_interval=0)
+    old_source, other_source, new_source = FakeFrames(), FakeFrames(), FakeFrames()
+    old = replays.start("cid", old_source.generator)
+    replays.start("another-cid", other_source.generator)
+    old_source.feed(data("a"))
+    next(old)  # Still attached: superseding does not wait for the grace period
+    replays.start("cid", new_source.generator)
+
+    old_source.feed(data("b"))
+    assert old_source.closed.wait(2)
+    assert list(old) == []
+    assert replays.stats() == {"streams": 3, "in_flight": 2}
+    other_source.feed(_END)
+    new_source.feed(_END)
+
+
+def test_oldest_streams_are_evicted_at_capacity(clock):
+    replays = ReplayBuffer(max_streams=2, heartbeat_interval=0)
+    sources = [FakeFrames() for _ in range(3)]
+    for n, source in enumerate(sources):
+        replays.start(f"cid-{n}", source.generator)
+    assert replays.stats()["streams"] == 2
+    for source in sources:
+        source.feed(_END)
+
+
+def test_async_reconnect_resumes_after_last_event_id(clock):
+    replays = ReplayBuffer(heartbeat_interval=0)
+
+    async def frames(feed: asyncio.Queue):
+        while True:
+            frame = await feed.get()
+            if frame is _END:
+                return
+            yield frame
+
+    async def scenario():
+        feed = asyncio.Queue()
+        first = replays.astart("cid", frames(feed))
+        feed.put_nowait(data("a"))
+        frame = await first.__anext__()
+        await first.aclose()
+        last_event_id = frame.split("\n", 1)[0][len("id: "):]
+        for frame in (data("b"), _END):
+            feed.put_nowait(frame)
+        resumed = replays.aresume(last_event_id, "cid")
+        return [frame async for frame in resumed]
+
+    resumed = asyncio.run(scenario())
+    assert "".join(resumed).endswith(data("b"))
+    assert "-1\n" not in "".join(resumed)
+    assert replays.stats() == {"streams": 1, "in_flight": 0}
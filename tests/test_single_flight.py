@@ -0,0 +1,111 @@
+import os
+import queue
+import sys
+import threading
+import time
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from cache.SingleFlight import SingleFlight
+
+_END = object()
+
+
+class FakeStream:
+    """An upstream stream the test feeds chunk by chunk."""
+
+    def __init__(self):
+        self.chunks: "queue.Queue" = queue.Queue()
+        self.closed = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self._generate()
+
+    def _generate(self):
+        try:
+            while True:
+                chunk = self.chunks.get(timeout=5)
+                if chunk is _END:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            self.closed.set()
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_late_joiner_gets_prefix_then_live_and_leader_meta():
+    flights, stream = SingleFlight(), FakeStream()
+    key = SingleFlight.key("What is a pulsar?", "prompt")
+    leader_meta = {"source": "upstream"}
+    leader, is_leader = flights.subscribe(key, stream, leader_meta)
+    assert is_leader
+    stream.chunks.put("one ")
+    assert next(leader) == "one "
+
+    follower_meta = {"source": "shared"}
+    follower, is_leader = flights.subscribe(SingleFlight.key("  what is a PULSAR? ", "prompt"), stream,
+                                            follower_meta)
+    assert not is_leader
+    assert next(follower) == "one "  # Replayed prefix
+    leader_meta["model"] = "m"
+    stream.chunks.put("two")
+    stream.chunks.put(_END)
+    assert list(leader) == ["two"]
+    assert list(follower) == ["two"]
+    assert stream.calls == 1
+    assert follower_meta == {"source": "shared", "model": "m"}
+    assert flights.stats() == {"in_flight": 0, "started": 1, "joined": 1}
+
+
+def test_error_reaches_every_subscriber():
+    flights, stream = SingleFlight(), FakeStream()
+    key = SingleFlight.key("q", "p")
+    first, _ = flights.subscribe(key, stream)
+    second, _ = flights.subscribe(key, stream)
+    stream.chunks.put("partial")
+    stream.chunks.put(RuntimeError("all models failed"))
+    for chunks in (first, second):
+        with pytest.raises(RuntimeError, match="all models failed"):
+            list(chunks)
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_upstream_is_abandoned_when_every_subscriber_leaves():
+    flights, stream = SingleFlight(), FakeStream()
+    key = SingleFlight.key("q", "p")
+    first, _ = flights.subscribe(key, stream)
+    second, _ = flights.subscribe(key, stream)
+    stream.chunks.put("a")
+    assert next(first) == "a" and next(second) == "a"
+    first.close()
+    second.close()
+    stream.chunks.put("b")  # The producer notices nobody is left on its next chunk
+    assert stream.closed.wait(2)
+    wait_for(lambda: flights.stats()["in_flight"] == 0)
+
+
+def test_finished_flight_is_forgotten():
+    flights, stream = SingleFlight(), FakeStream()
+    key = SingleFlight.key("q", "p")
+    chunks, _ = flights.subscribe(key, stream)
+    stream.chunks.put(_END)
+    assert list(chunks) == []
+    wait_for(lambda: flights.stats()["in_flight"] == 0)
+    _, is_leader = flights.subscribe(key, stream)
+    assert is_leader
+    stream.chunks.put(_END)
+    assert flights.stats()["started"] == 2
@@ -0,0 +1,138 @@
+import os
+import socket
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+import routing.Upstream as upstream
+from routing.Upstream import StallWatchdog, StreamStalled
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class NetworkStream:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def get_extra_info(self, name):
+        return self.sock if name == "socket" else None
+
+
+class SocketStream:
+    """A completion stream backed by a real socket, so the watchdog's
+    shutdown wakes the blocked read the way it does an httpx response."""
+
+    def __init__(self, chunks=()):
+        self.sock, self.peer = socket.socketpair()
+        self.response = SimpleNamespace(extensions={"network_stream": NetworkStream(self.sock)})
+        self.chunks = list(chunks)
+
+    def __iter__(self):
+        for content in self.chunks:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+        while self.sock.recv(1):
+            pass
+
+    def close(self):
+        self.sock.close()
+        self.peer.close()
+
+
+def test_deadlines_follow_arm_and_pause(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream, "time", SimpleNamespace(monotonic=clock, sleep=time.sleep))
+    watchdog = StallWatchdog(first_token_timeout=10, stall_timeout=5)
+    watch = upstream._Watch("m", None)
+    watchdog.arm(watch, watchdog.first_token_timeout, "first token")
+    assert watch.deadline == 1010 and watch.phase == "first token"
+    watchdog.pause(watch)  # The consumer holds the chunk: not the model's time
+    assert watch.deadline == float("inf")
+    clock.now += 60
+    watchdog.arm(watch)
+    assert watch.deadline == 1065 and watch.phase == "content chunk"
+    watchdog.arm(watch, 0)  # A zero timeout disables the deadline
+    assert watch.deadline == float("inf")
+
+
+def test_expired_stream_is_shut_down_and_forgotten():
+    watchdog = StallWatchdog(first_token_timeout=0.05, stall_timeout=0.05, resolution=0.01)
+    stream = SocketStream()
+    try:
+        watch = watchdog.watch(stream, "m")
+        assert list(stream) == []  # recv() returns once the socket is shut down
+        assert watch.expired
+        assert watchdog._watches == {}
+        assert isinstance(watch.error(), StreamStalled) and watch.error().phase == "first token"
+    finally:
+        stream.close()
+
+
+def test_released_watch_never_fires():
+    watchdog = StallWatchdog(first_token_timeout=0.05, stall_timeout=0.05, resolution=0.01)
+    stream = SocketStream()
+    try:
+        watch = watchdog.watch(stream, "m")
+        watchdog.release(watch)
+        stream.peer.settimeout(0.2)
+        stream.sock.settimeout(0.2)
+        with pytest.raises(socket.timeout):
+            stream.sock.recv(1)  # Still open: nobody shut it down
+        assert not watch.expired
+    finally:
+        stream.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-test")
+    import ChatClient as chat_client_module
+    client = chat_client_module.ChatClient()
+    client.watchdog = StallWatchdog(first_token_timeout=0.05, stall_timeout=0.05, resolution=0.01)
+    return client
+
+
+def test_client_raises_stream_stalled_for_a_silent_model(client):
+    stream = SocketStream()
+    try:
+        with pytest.raises(StreamStalled, match="No first token from model"):
+            list(client._iter_content(stream))
+        assert client.watchdog._watches == {}
+    finally:
+        stream.close()
+
+
+def test_client_releases_the_watch_when_the_consumer_leaves(client):
+    stream = SocketStream(["hello", " world"])
+    try:
+        chunks = client._iter_content(stream)
+        assert next(chunks) == "hello"
+        assert len(client.watchdog._watches) == 1
+        chunks.close()  # Client disconnect while holding the chunk
+        assert client.watchdog._watches == {}
+    finally:
+        stream.close()
+
+
+def test_client_does_not_count_a_slow_consumer_as_a_stall(client):
+    stream = SocketStream(["hello"])
+    try:
+        chunks = client._iter_content(stream)
+        assert next(chunks) == "hello"
+        time.sleep(0.2)  # Longer than the stall timeout, but the watch is paused
+        assert len(client.watchdog._watches) == 1
+        with pytest.raises(StreamStalled, match="No content chunk"):
+            list(chunks)  # Re-armed on resume; the silent model then stalls
+    finally:
+        stream.close()